@@ -0,0 +1,131 @@
+from collections import defaultdict
+
+from sqlalchemy import event, literal, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.sql import func
+
+from app import db
+from app.models import Exam, Visit, User, MetricAggregate
+
+KEY = ('metric_id', 'gender', 'birth_date')
+
+
+def apply(connection, visit_id, metric_id, value_sum, value_count):
+    """Adds a sum/count delta to the aggregate row of the visit's user.
+
+    Users without gender or birth date never match a cohort, so their
+    exams are not aggregated.
+    """
+    users = User.__table__
+    visits = Visit.__table__
+    source = select([
+        literal(metric_id, db.Integer),
+        users.c.gender,
+        users.c.birth_date,
+        literal(value_sum, db.BigInteger),
+        literal(value_count, db.Integer)
+    ]).select_from(visits.join(users, users.c.id == visits.c.user_id)).where(
+        (visits.c.id == visit_id) & users.c.gender.isnot(None) & users.c.birth_date.isnot(None)
+    )
+    upsert(connection, source)
+
+
+def upsert(connection, source):
+    """Adds the (metric_id, gender, birth_date, value_sum, value_count) rows of `source`."""
+    table = MetricAggregate.__table__
+    statement = insert(table).from_select(list(KEY) + ['value_sum', 'value_count'], source)
+    statement = statement.on_conflict_do_update(
+        index_elements=list(KEY),
+        set_={
+            'value_sum': table.c.value_sum + statement.excluded.value_sum,
+            'value_count': table.c.value_count + statement.excluded.value_count
+        }
+    )
+    connection.execute(statement)
+
+
+def add_value(connection, visit_id, metric_id, value, sign):
+    """Adds (sign=1) or removes (sign=-1) one exam value."""
+    if value is not None:
+        apply(connection, visit_id, metric_id, sign * Exam.parse_value(value), sign)
+
+
+def subtract(connection, condition):
+    """Removes the exams matching `condition` before a set-based delete,
+    which the ORM events never see."""
+    exams = Exam.__table__
+    users = User.__table__
+    visits = Visit.__table__
+    source = select([
+        exams.c.metric_id,
+        users.c.gender,
+        users.c.birth_date,
+        -func.sum(exams.c.value),
+        -func.count(exams.c.value)
+    ]).select_from(
+        exams.join(visits, visits.c.id == exams.c.visit_id).join(users, users.c.id == visits.c.user_id)
+    ).where(
+        condition & exams.c.value.isnot(None) & users.c.gender.isnot(None) & users.c.birth_date.isnot(None)
+    ).group_by(exams.c.metric_id, users.c.gender, users.c.birth_date)
+    upsert(connection, source)
+
+
+def add_many(connection, rows):
+    """Aggregates exams inserted without the ORM (see Exam.insert_many)."""
+    deltas = defaultdict(lambda: [0, 0])
+    for row in rows:
+        if row['value'] is None:
+            continue
+        delta = deltas[row['visit_id'], row['metric_id']]
+        delta[0] += Exam.parse_value(row['value'])
+        delta[1] += 1
+    for (visit_id, metric_id), (value_sum, value_count) in deltas.items():
+        apply(connection, visit_id, metric_id, value_sum, value_count)
+
+
+# the Exam events are in app.events, exams and visits go with ON DELETE CASCADE, metric_aggregates rows
+# of a deleted metric too
+
+@event.listens_for(Visit, 'before_delete')
+def visit_deleted(mapper, connection, target):
+    subtract(connection, Exam.__table__.c.visit_id == target.id)
+
+
+@event.listens_for(User, 'before_delete')
+def user_deleted(mapper, connection, target):
+    subtract(connection, Visit.__table__.c.user_id == target.id)
+
+
+def live_aggregates():
+    return db.session.query(
+        Exam.metric_id, User.gender, User.birth_date, func.sum(Exam.value), func.count(Exam.value)
+    ).join(Exam.visit).join(Visit.user).filter(
+        Exam.value.isnot(None), User.gender.isnot(None), User.birth_date.isnot(None)
+    ).group_by(Exam.metric_id, User.gender, User.birth_date)
+
+
+def rebuild():
+    table = MetricAggregate.__table__
+    db.session.execute(table.delete())
+    db.session.execute(table.insert().from_select(
+        list(KEY) + ['value_sum', 'value_count'], live_aggregates().statement
+    ))
+    db.session.commit()
+
+
+def check():
+    """Returns the (key, stored, live) triples where the store is stale."""
+    stored = {
+        (row.metric_id, row.gender, row.birth_date): (row.value_sum, row.value_count)
+        for row in MetricAggregate.query.filter(MetricAggregate.value_count != 0)
+    }
+    mismatches = []
+    for metric_id, gender, birth_date, value_sum, value_count in live_aggregates():
+        key = (metric_id, gender, birth_date)
+        live = (int(value_sum), value_count)
+        current = stored.pop(key, None)
+        if current != live:
+            mismatches.append((key, current, live))
+    for key, value in stored.items():
+        mismatches.append((key, value, None))
+    return mismatches
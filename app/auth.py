@@ -0,0 +1,134 @@
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+from jwt import DecodeError, ExpiredSignatureError
+from six import wraps
+
+from flask import current_app, request
+from sqlalchemy import event
+from sqlalchemy.orm.exc import NoResultFound
+
+from app.encoding import jsonify
+from app.models import User
+from app.replicas import replica_router
+
+
+class Principal(object):
+    """What the handlers need to know about the authenticated user."""
+    __slots__ = ('id', 'admin', 'gender')
+
+    def __init__(self, id, admin, gender):
+        self.id = id
+        self.admin = bool(admin)
+        self.gender = gender
+
+    @staticmethod
+    def from_user(user):
+        return Principal(user.id, user.admin, user.gender)
+
+    @staticmethod
+    def from_claims(data):
+        try:
+            return Principal(data['id'], data['admin'], data['gender'])
+        except KeyError:
+            return None
+
+
+class PrincipalCache(object):
+    """Per-worker LRU cache of principals by user id, with a TTL."""
+
+    def __init__(self, max_size=1024, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, max_size, ttl):
+        with self._lock:
+            self.max_size = max_size
+            self.ttl = ttl
+            self._items.clear()
+
+    def get(self, user_id):
+        with self._lock:
+            item = self._items.get(user_id)
+            if item is None:
+                return None
+            principal, expires = item
+            if expires < time.monotonic():
+                del self._items[user_id]
+                return None
+            self._items.move_to_end(user_id)
+            return principal
+
+    def set(self, principal):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._items[principal.id] = (principal, time.monotonic() + self.ttl)
+            self._items.move_to_end(principal.id)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._items.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+user_cache = PrincipalCache()
+
+
+def load_principal(data, trust_claims=False):
+    if trust_claims:
+        principal = Principal.from_claims(data)
+        if principal is not None:
+            return principal
+
+    principal = user_cache.get(data['id'])
+    if principal is None:
+        user = User.query.filter_by(id=data['id']).first()
+        if user is None:
+            return None
+        principal = Principal.from_user(user)
+        user_cache.set(principal)
+    return principal
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def invalidate_user(mapper, connection, target):
+    user_cache.invalidate(target.id)
+
+
+def token_required(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+
+        if 'Authorization' not in request.headers:
+            return jsonify({'message': 'Token is missing!'}), 401
+
+        token = request.headers['Authorization']
+
+        try:
+            data = jwt.decode(token, current_app.config['SECRET'])
+            current_user = load_principal(data, current_app.config['AUTH_TRUST_TOKEN_CLAIMS'])
+        except DecodeError:
+            return jsonify({'message': 'Token is invalid!'}), 401
+        except NoResultFound:
+            return jsonify({'message': 'Token is invalid!'}), 401
+        except ExpiredSignatureError:
+            return jsonify({'message': 'Token is invalid!'}), 401
+
+        if current_user is None:
+            return jsonify({'message': 'Token is invalid!'}), 401
+
+        replica_router.route(current_user.id)
+        return f(current_user, *args, **kwargs)
+
+    return decorated
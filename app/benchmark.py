@@ -0,0 +1,289 @@
+import datetime
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from flask.json import JSONEncoder
+
+from app import db, encoding
+from app.models import Exam, Visit, User, Metric
+from app.serializers import exam_schema
+from app.unit_of_work import unit_of_work
+
+QUERIES = re.compile(r'desc="(\d+) queries"')
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STARTUP_SCRIPT = (
+    'import resource, time\n'
+    'start = time.perf_counter()\n'
+    'from run import app\n'
+    'print(time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)\n'
+)
+
+
+class TestClientTarget(object):
+    """Drives the app in process through Flask's test client."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def request(self, method, path, body=None, token=None):
+        headers = {'Authorization': token} if token else {}
+        response = self.app.test_client().open(
+            path, method=method, headers=headers, content_type='application/json',
+            data=None if body is None else json.dumps(body)
+        )
+        return response.status_code, response.headers.get('Server-Timing', ''), response.get_data()
+
+
+class HttpTarget(object):
+    """Drives a running server, e.g. gunicorn with sync or gevent workers."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def request(self, method, path, body=None, token=None):
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = token
+        data = None if body is None else json.dumps(body).encode('utf-8')
+        try:
+            response = urlopen(Request(self.base_url + path, data=data, headers=headers, method=method))
+        except HTTPError as error:
+            response = error
+        return response.status, response.headers.get('Server-Timing', ''), response.read()
+
+
+def login(target, username, password):
+    status, _, body = target.request('POST', '/login', {'username': username, 'password': password})
+    if status != 200:
+        raise RuntimeError('login as {} failed with {}'.format(username, status))
+    return json.loads(body.decode('utf-8'))['access_token']
+
+
+def scenarios(user, password, read_only=False):
+    """(name, method, path, body, token) for every route worth measuring."""
+    user_row = User.query.filter_by(username=user).first()
+    visit = Visit.query.filter_by(user_id=user_row.id).first()
+    metrics = Metric.query.filter_by(gender=user_row.gender).all()
+    exam_metric = Exam.query.filter_by(visit_id=visit.id).first().metric
+    cohort = '/exams/statistics?gender={}&age=30,60'.format(user_row.gender)
+    ranged = '{}&{}={},{}'.format(
+        cohort, exam_metric.name, exam_metric.healthy_range_min, exam_metric.healthy_range_max
+    )
+
+    items = [
+        ('exams page', 'GET', '/exams?limit=100', None, 'user'),
+        ('exams admin page', 'GET', '/exams?limit=1000', None, 'admin'),
+        ('exams of visit', 'GET', '/exams?visitId={}'.format(visit.id), None, 'user'),
+        ('visits', 'GET', '/visits', None, 'user'),
+        ('visits by score', 'GET', '/visits?sort=score&limit=100', None, 'admin'),
+        ('statistics own', 'GET', '/exams/statistics', None, 'user'),
+        ('statistics cohort', 'GET', cohort, None, 'admin'),
+        ('statistics cohort ranges', 'GET', ranged, None, 'admin'),
+        ('statistics cohort details', 'GET', cohort + '&details=1', None, 'admin'),
+        ('visits exams', 'GET', '/visits/exams?userId={}'.format(user_row.id), None, 'admin'),
+        ('exams out of range', 'GET', '/exams?status=out_of_range&sort=deviation&limit=100', None, 'admin'),
+        ('metrics', 'GET', '/metrics', None, 'user'),
+        ('metrics data', 'GET', '/metrics/data', None, 'user'),
+        ('login', 'POST', '/login', {'username': user, 'password': password}, None),
+    ]
+    if not read_only:
+        items += [
+            ('exam create', 'POST', '/exams', {'metricId': exam_metric.id, 'visitId': visit.id, 'value': 90}, 'user'),
+            ('visit exams batch', 'POST', '/visits/{}/exams'.format(visit.id),
+             [{'metricId': metric.id, 'value': metric.healthy_range_min} for metric in metrics], 'user'),
+        ]
+    return items
+
+
+def percentile(sorted_values, q):
+    index = max(0, min(len(sorted_values) - 1, int(round(q / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def measure(target, method, path, body, token, requests, concurrency):
+    def call(_):
+        start = time.perf_counter()
+        status, timing, _ = target.request(method, path, body, token)
+        elapsed = time.perf_counter() - start
+        queries = QUERIES.search(timing)
+        return elapsed, status, int(queries.group(1)) if queries else None
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(call, range(requests)))
+    wall = time.perf_counter() - start
+
+    latencies = sorted(result[0] for result in results)
+    queries = [result[2] for result in results if result[2] is not None]
+    return {
+        'p50': percentile(latencies, 50) * 1000,
+        'p95': percentile(latencies, 95) * 1000,
+        'p99': percentile(latencies, 99) * 1000,
+        'throughput': requests / wall,
+        'queries': sum(queries) / float(len(queries)) if queries else None,
+        'errors': sum(1 for result in results if result[1] >= 400)
+    }
+
+
+def run(target, admin, user, password, requests=100, concurrency=1, read_only=False):
+    tokens = {'admin': login(target, admin, password), 'user': login(target, user, password)}
+    report = []
+    for name, method, path, body, role in scenarios(user, password, read_only):
+        # one warm-up request, so caches and pools don't skew p99
+        target.request(method, path, body, tokens.get(role))
+        report.append((name, measure(target, method, path, body, tokens.get(role), requests, concurrency)))
+    return report
+
+
+def login_benchmark(target, user, password, logins=200, concurrency=8):
+    """Latency of /metrics alone and while `concurrency` clients log in.
+
+    Compare servers started with PASSWORD_HASH_EXECUTOR=thread and auto:
+    when the hashes run in the web workers, /metrics waits behind them.
+    """
+    token = login(target, user, password)
+    probes = max(10, logins // concurrency)
+    target.request('GET', '/metrics', None, token)
+    report = [('metrics idle', measure(target, 'GET', '/metrics', None, token, probes, 1))]
+    body = {'username': user, 'password': password}
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        logging_in = executor.submit(measure, target, 'POST', '/login', body, None, logins, concurrency)
+        report.append(('metrics during logins', measure(target, 'GET', '/metrics', None, token, probes, 1)))
+        report.append(('login', logging_in.result()))
+    return report
+
+
+def format_report(report):
+    lines = ['{:<28} {:>9} {:>9} {:>9} {:>9} {:>8} {:>7}'.format(
+        'scenario', 'p50 ms', 'p95 ms', 'p99 ms', 'req/s', 'queries', 'errors'
+    )]
+    for name, stats in report:
+        lines.append('{:<28} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f} {:>8} {:>7}'.format(
+            name, stats['p50'], stats['p95'], stats['p99'], stats['throughput'],
+            '-' if stats['queries'] is None else '{:.1f}'.format(stats['queries']), stats['errors']
+        ))
+    return '\n'.join(lines)
+
+
+def write_benchmark(user, writes=500):
+    """(path, writes/s, ms per write) of POST /exams' database work, done
+    the old way and through the unit of work, outside of requests.
+
+    The old way committed the exam, then set the visit's date_modified
+    from the expired exam and committed again. Both add `writes` exams to
+    the user's first visit.
+    """
+    user_row = User.query.filter_by(username=user).first()
+    visit_id = Visit.query.filter_by(user_id=user_row.id).first().id
+    metric_id = Exam.query.filter_by(visit_id=visit_id).first().metric_id
+    db.session.commit()
+
+    def double_commit():
+        metric = Metric.query.get(metric_id)
+        visit = Visit.query.get(visit_id)
+        exam = Exam(value=90, metric=metric, visit=visit)
+        db.session.add(exam)
+        db.session.commit()
+        visit.date_modified = exam.date_modified
+        db.session.add(visit)
+        db.session.commit()
+        exam_schema.dump(exam)
+
+    def single_commit():
+        metric = Metric.query.get(metric_id)
+        visit = Visit.query.get(visit_id)
+        exam = Exam(value=90, metric=metric, visit=visit)
+        exam.save()
+        Visit.touch(visit.id)
+        exam_schema.dump(exam)
+        unit_of_work.commit()
+
+    report = []
+    for name, write in (('double commit', double_commit), ('unit of work', single_commit)):
+        # warm-up, the first write loads the mappers and fills the pool
+        write()
+        start = time.perf_counter()
+        for _ in range(writes):
+            write()
+        elapsed = time.perf_counter() - start
+        report.append((name, writes / elapsed, elapsed / writes * 1000))
+    return report
+
+
+def exam_rows(rows):
+    """Row tuples shaped like exam_schema.rows(), without a database."""
+    now = datetime.datetime.now()
+    return [
+        (i, i % 300, now, now, i // 12, i % 24, 'metric {}'.format(i % 24), 'normal', (i % 300) / 300.0, 0.0)
+        for i in range(rows)
+    ]
+
+
+def encode_benchmark(rows=10000, repeat=5):
+    """Milliseconds to build and encode `rows` exam rows, best of `repeat`."""
+    data = exam_rows(rows)
+    encoders = [('flask', lambda obj: json.dumps(obj, cls=JSONEncoder, separators=(',', ':')).encode('utf-8'))]
+    encoders += [(name, dumps) for name, dumps in sorted(encoding.ENCODERS.items())
+                 if name != 'orjson' or encoding.orjson is not None]
+
+    report = []
+    for name, dumps in encoders:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            dumps(exam_schema.dump_rows(data))
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        report.append((name, best * 1000))
+    return report
+
+
+def startup_benchmark(runs=5):
+    """(process seconds, app import seconds, peak RSS KiB) of `runs` fresh interpreters."""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.check_output([sys.executable, '-c', STARTUP_SCRIPT], cwd=ROOT)
+        elapsed = time.perf_counter() - start
+        seconds, rss = output.decode('utf-8').split()[-2:]
+        samples.append((elapsed, float(seconds), int(rss)))
+    return samples
+
+
+def memory(pid):
+    """Rss, Pss and private KiB of a process, from /proc (Linux 4.14+)."""
+    fields = {}
+    with open('/proc/{}/smaps_rollup'.format(pid)) as smaps:
+        for line in smaps:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1])
+    return fields['Rss'], fields['Pss'], fields['Private_Clean'] + fields['Private_Dirty']
+
+
+def worker_memory(master_pid):
+    """(pid, rss, pss, private) of every worker of a running gunicorn master.
+
+    Pss splits the pages shared copy-on-write with the master, so with
+    --preload it drops well below Rss.
+    """
+    workers = []
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open('/proc/{}/stat'.format(name)) as stat:
+                ppid = int(stat.read().rsplit(')', 1)[1].split()[1])
+            if ppid == master_pid:
+                workers.append((int(name),) + memory(name))
+        except (IOError, IndexError, ValueError):
+            continue
+    return sorted(workers)
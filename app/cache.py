@@ -0,0 +1,118 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from flask import request, Response
+
+from app.encoding import dumps
+
+
+class LocalBackend(object):
+    """In-process LRU backend, every worker keeps its own copy.
+
+    At most `max_size` values are kept, the least recently used go first,
+    so keys of old versions and expired values don't pile up.
+    """
+
+    def __init__(self, ttl, max_size=1024):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._items = OrderedDict()
+        # counters are never evicted, a reset would reuse stale versions
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._counters:
+                return self._counters[key]
+            item = self._items.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._items[key] = (value, time.monotonic() + self.ttl)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+
+class RedisBackend(object):
+    """Shared backend, invalidations are seen by every worker."""
+
+    def __init__(self, ttl, url):
+        import redis
+
+        self.ttl = ttl
+        self.client = redis.StrictRedis.from_url(url)
+
+    def get(self, key):
+        value = self.client.get(key)
+        return None if value is None else value.decode('utf-8')
+
+    def set(self, key, value):
+        self.client.set(key, value, ex=self.ttl)
+
+    def incr(self, key):
+        return self.client.incr(key)
+
+
+BACKENDS = {
+    'local': lambda config: LocalBackend(config['CACHE_TTL'], config.get('CACHE_SIZE', 1024)),
+    'redis': lambda config: RedisBackend(config['CACHE_TTL'], config['CACHE_REDIS_URL']),
+}
+
+
+class ResponseCache(object):
+    """Caches JSON response bodies under a namespace.
+
+    invalidate() bumps the namespace version instead of deleting keys,
+    so it works the same on every backend.
+    """
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+        self.backend = LocalBackend(ttl=300)
+
+    def configure(self, config):
+        self.backend = BACKENDS[config['CACHE_BACKEND']](config)
+
+    def version(self):
+        return self.backend.get('{}:version'.format(self.namespace)) or 0
+
+    def invalidate(self):
+        self.backend.incr('{}:version'.format(self.namespace))
+
+    def response(self, key, build):
+        key = '{}:{}:{}'.format(self.namespace, self.version(), key)
+        entry = self.backend.get(key)
+        if entry is None:
+            body = dumps(build()).decode('utf-8')
+            entry = '{} {}'.format(hashlib.sha1(body.encode('utf-8')).hexdigest(), body)
+            self.backend.set(key, entry)
+        etag, body = entry.split(' ', 1)
+
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(body, mimetype='application/json')
+        response.set_etag(etag)
+        return response
+
+
+catalog_cache = ResponseCache('catalog')
@@ -0,0 +1,74 @@
+from sqlalchemy import case, or_, cast
+from sqlalchemy.sql import func
+
+from app import db
+from app.models import Exam, Metric
+
+STATUS_FILTERS = {
+    'low': ('low',),
+    'normal': ('normal',),
+    'high': ('high',),
+    'unknown': ('unknown',),
+    'out_of_range': ('low', 'high'),
+}
+SORTS = (None, 'deviation')
+
+# SQL expressions over exams joined with metrics, classify() is the same in Python
+
+status = case([
+    (or_(Exam.value.is_(None), Metric.healthy_range_min.is_(None), Metric.healthy_range_max.is_(None)), 'unknown'),
+    (Exam.value < Metric.healthy_range_min, 'low'),
+    (Exam.value > Metric.healthy_range_max, 'high'),
+], else_='normal')
+
+total_width = func.nullif(Metric.total_range_max - Metric.total_range_min, 0)
+
+# where the value falls in the total range, 0 at its min and 1 at its max
+position = cast(Exam.value - Metric.total_range_min, db.Float) / total_width
+
+# distance outside the healthy range, relative to the total range (or to
+# the healthy range for metrics without one), 0 inside the healthy range
+deviation = cast(
+    func.greatest(Metric.healthy_range_min - Exam.value, Exam.value - Metric.healthy_range_max, 0), db.Float
+) / func.coalesce(total_width, func.nullif(Metric.healthy_range_max - Metric.healthy_range_min, 0), 1)
+
+
+def parse_status(value):
+    """Statuses matching the `status` parameter, () for all of them and None when invalid."""
+    if value is None:
+        return ()
+    return STATUS_FILTERS.get(value)
+
+
+def width(low, high):
+    if low is None or high is None or high == low:
+        return None
+    return high - low
+
+
+def classify(value, metric):
+    """(status, position, deviation) of an exam value, like the SQL expressions."""
+    low, high = metric.healthy_range_min, metric.healthy_range_max
+    if value is None or low is None or high is None:
+        exam_status = 'unknown'
+    elif value < low:
+        exam_status = 'low'
+    elif value > high:
+        exam_status = 'high'
+    else:
+        exam_status = 'normal'
+
+    total = width(metric.total_range_min, metric.total_range_max)
+    if value is None or total is None:
+        exam_position = None
+    else:
+        exam_position = (value - metric.total_range_min) / float(total)
+
+    distances = [0]
+    if value is not None:
+        distances += [distance for distance in (
+            None if low is None else low - value,
+            None if high is None else value - high
+        ) if distance is not None]
+    exam_deviation = max(distances) / float(total or width(low, high) or 1)
+    return exam_status, exam_position, exam_deviation
@@ -0,0 +1,94 @@
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, get_state
+from sqlalchemy import event, orm
+from sqlalchemy.pool import NullPool, QueuePool
+from sqlalchemy.sql.dml import UpdateBase
+
+POOL_OPTIONS = ('pool_size', 'max_overflow', 'pool_timeout', 'pool_recycle')
+
+
+class RoutingSession(SignallingSession):
+    """Session reading from the bind in info['replica'] when one is set.
+
+    Flushes and INSERT/UPDATE/DELETE statements stay on the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None):
+        replica = self.info.get('replica')
+        if replica is not None and not self._flushing and not isinstance(clause, UpdateBase):
+            return get_state(self.app).db.get_engine(self.app, bind=replica)
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+
+class PooledSQLAlchemy(SQLAlchemy):
+    """SQLAlchemy extension with the engine options Flask-SQLAlchemy lacks.
+
+    SQLALCHEMY_POOL_PRE_PING checks connections on checkout,
+    SQLALCHEMY_STATEMENT_TIMEOUT (ms) bounds every statement and
+    SQLALCHEMY_PGBOUNCER makes the engine safe behind a pgbouncer in
+    transaction pooling mode: no client side pool and only transaction
+    scoped settings. psycopg2 never uses server-side prepared statements,
+    so there is nothing to turn off for those.
+    """
+
+    def init_app(self, app):
+        app.config.setdefault('SQLALCHEMY_POOL_PRE_PING', False)
+        app.config.setdefault('SQLALCHEMY_STATEMENT_TIMEOUT', None)
+        app.config.setdefault('SQLALCHEMY_PGBOUNCER', False)
+        super(PooledSQLAlchemy, self).init_app(app)
+
+        timeout = app.config['SQLALCHEMY_STATEMENT_TIMEOUT']
+        if app.config['SQLALCHEMY_PGBOUNCER'] and timeout:
+            # startup options are rejected by pgbouncer and a plain SET
+            # would leak to other clients of the server connection
+            event.listen(SignallingSession, 'after_begin', statement_timeout_setter(timeout))
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def lift_statement_timeout(self):
+        """Lets the later transactions of the process run for as long as
+        they need, for the manage.py maintenance commands."""
+        event.listen(SignallingSession, 'after_begin', statement_timeout_setter(0))
+
+    def reset_engines(self, app):
+        """Forgets the app's engines, the next use creates them again.
+
+        Called in forked workers: an engine created before the fork would
+        share its pooled sockets with the master and the other workers.
+        """
+        get_state(app).connectors.clear()
+
+    def apply_driver_hacks(self, app, info, options):
+        super(PooledSQLAlchemy, self).apply_driver_hacks(app, info, options)
+        if info.drivername.startswith('sqlite'):
+            return
+
+        options['pool_pre_ping'] = app.config['SQLALCHEMY_POOL_PRE_PING']
+        timeout = app.config['SQLALCHEMY_STATEMENT_TIMEOUT']
+
+        if app.config['SQLALCHEMY_PGBOUNCER']:
+            options['poolclass'] = NullPool
+            for key in POOL_OPTIONS:
+                options.pop(key, None)
+        elif timeout:
+            options.setdefault('connect_args', {})['options'] = '-c statement_timeout={:d}'.format(timeout)
+
+
+def statement_timeout_setter(timeout):
+    def set_statement_timeout(session, transaction, connection):
+        connection.execute('SET LOCAL statement_timeout = {:d}'.format(timeout))
+
+    return set_statement_timeout
+
+
+def pool_status(engine):
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return {'pool': type(pool).__name__}
+    return {
+        'pool': type(pool).__name__,
+        'size': pool.size(),
+        'checkedIn': pool.checkedin(),
+        'checkedOut': pool.checkedout(),
+        'overflow': pool.overflow()
+    }
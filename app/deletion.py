@@ -0,0 +1,102 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import select
+from sqlalchemy.sql import func
+
+from app import db, aggregates, scores
+from app.models import Exam, Visit, User, Metric, Deletion
+from app.unit_of_work import unit_of_work
+
+logger = logging.getLogger('app.deletion')
+
+MODELS = {'metric': Metric, 'visit': Visit, 'user': User}
+
+
+def exams_of(kind, id):
+    exams = Exam.__table__
+    if kind == 'metric':
+        return exams.c.metric_id == id
+    if kind == 'visit':
+        return exams.c.visit_id == id
+    visits = Visit.__table__
+    return exams.c.visit_id.in_(select([visits.c.id]).where(visits.c.user_id == id))
+
+
+class ChunkedDeleter(object):
+    """Deletes a metric, visit or user with many exams in the background.
+
+    The exams go DELETE_CHUNK_SIZE at a time, each chunk in its own
+    transaction with its aggregate and score updates and its progress in
+    the deletions row, so no lock is held for long, every worker reports
+    the same progress and an interrupted deletion leaves consistent data
+    behind. The row itself is deleted last, like a synchronous delete.
+    `manage.py resume_deletions` finishes the interrupted ones.
+    """
+
+    def __init__(self):
+        self.executor = None
+        self.chunk_size = 10000
+
+    def configure(self, config):
+        self.executor = ThreadPoolExecutor(max_workers=config['DELETE_WORKERS'])
+        self.chunk_size = config['DELETE_CHUNK_SIZE']
+
+    def start(self, app, kind, id, user_id):
+        total = db.session.execute(select([func.count()]).where(exams_of(kind, id))).scalar()
+        deletion = Deletion(kind=kind, target_id=id, user_id=user_id, total=total)
+        deletion.save()
+        # the thread must see the committed row
+        deletion_id = deletion.id
+        unit_of_work.after_commit(lambda: self.executor.submit(self.run, app, deletion_id))
+        return deletion
+
+    def resume(self, app):
+        """Runs the deletions left queued, running or failed, in the foreground."""
+        ids = [row[0] for row in Deletion.query.filter(Deletion.status != 'done').with_entities(Deletion.id)]
+        db.session.commit()
+        for deletion_id in ids:
+            self.run(app, deletion_id)
+        return ids
+
+    def run(self, app, deletion_id):
+        exams = Exam.__table__
+        deletions = Deletion.__table__
+        this = deletions.c.id == deletion_id
+        with app.app_context():
+            try:
+                deletion = db.session.execute(select([deletions]).where(this)).first()
+                condition = exams_of(deletion.kind, deletion.target_id)
+                db.session.execute(deletions.update().where(this).values(status='running'))
+                db.session.commit()
+                while True:
+                    # a deletion resumed while it still runs elsewhere
+                    # takes turns, never subtracting a chunk twice
+                    db.session.execute(select([deletions.c.id]).where(this).with_for_update())
+                    ids = [row[0] for row in db.session.execute(
+                        select([exams.c.id]).where(condition).limit(self.chunk_size)
+                    )]
+                    if not ids:
+                        break
+                    connection = db.session.connection()
+                    chunk = exams.c.id.in_(ids)
+                    aggregates.subtract(connection, chunk)
+                    scores.subtract(connection, chunk)
+                    connection.execute(exams.delete().where(chunk))
+                    connection.execute(deletions.update().where(this).values(deleted=deletions.c.deleted + len(ids)))
+                    db.session.commit()
+
+                target = MODELS[deletion.kind].query.get(deletion.target_id)
+                if target is not None:
+                    target.delete()
+                db.session.execute(deletions.update().where(this).values(status='done'))
+                unit_of_work.mark()
+                unit_of_work.commit()
+            except Exception:
+                logger.exception('deletion %s failed', deletion_id)
+                unit_of_work.rollback()
+                db.session.execute(deletions.update().where(this).values(status='failed'))
+                db.session.commit()
+
+
+deleter = ChunkedDeleter()
@@ -0,0 +1,115 @@
+import numpy as np
+from sqlalchemy import select
+
+from app import db
+from app.models import Exam, Metric
+
+DEFAULT_PERCENTILES = (5, 25, 50, 75, 95)
+DEFAULT_BINS = 10
+
+
+def parse_percentiles(value):
+    if value is None:
+        return DEFAULT_PERCENTILES
+    try:
+        percentiles = [float(q) for q in value.split(',')]
+    except ValueError:
+        return None
+    if not percentiles or any(not 0 <= q <= 100 for q in percentiles):
+        return None
+    return percentiles
+
+
+def load_values(visit_ids):
+    """Returns (metric_ids, values) of the cohort's exams, sorted by metric then value."""
+    rows = db.session.execute(
+        select([Exam.metric_id, Exam.value]).where(Exam.visit_id.in_(visit_ids)).where(Exam.value.isnot(None))
+    ).fetchall()
+    data = np.array(rows, dtype=np.int64).reshape(-1, 2)
+    order = np.lexsort((data[:, 1], data[:, 0]))
+    return data[order, 0], data[order, 1].astype(np.float64)
+
+
+def metric_ranges(metric_ids):
+    rows = Metric.query.filter(Metric.id.in_(metric_ids.tolist())).with_entities(
+        Metric.id, Metric.name, Metric.total_range_min, Metric.total_range_max,
+        Metric.healthy_range_min, Metric.healthy_range_max
+    ).all()
+    by_id = {row[0]: row for row in rows}
+    names = [by_id[metric_id][1] for metric_id in metric_ids]
+    bounds = np.array(
+        [[np.nan if bound is None else bound for bound in by_id[metric_id][2:]] for metric_id in metric_ids],
+        dtype=np.float64
+    ).reshape(-1, 4)
+    return names, bounds
+
+
+def quantiles(values, starts, counts, percentiles):
+    # linear interpolation like np.percentile, for every group at once;
+    # values are sorted inside each group
+    position = (counts[:, None] - 1) * (np.asarray(percentiles, dtype=np.float64)[None, :] / 100.0)
+    lower = np.floor(position).astype(np.int64)
+    upper = np.ceil(position).astype(np.int64)
+    low = values[starts[:, None] + lower]
+    high = values[starts[:, None] + upper]
+    return low + (high - low) * (position - lower)
+
+
+def histograms(values, groups, bounds, n_groups, bins):
+    # same bins as np.histogram over [total_range_min, total_range_max],
+    # values outside the range and metrics without one are not counted
+    low = bounds[groups, 0]
+    high = bounds[groups, 1]
+    width = high - low
+    with np.errstate(invalid='ignore', divide='ignore'):
+        inside = (values >= low) & (values <= high) & (width > 0)
+        index = np.floor((values - low) / width * bins)
+    index = np.clip(np.where(inside, index, 0), 0, bins - 1).astype(np.int64)
+    counts = np.bincount(groups[inside] * bins + index[inside], minlength=n_groups * bins)
+    return counts.reshape(n_groups, bins)
+
+
+def describe_cohort(visit_ids, percentiles=DEFAULT_PERCENTILES, bins=DEFAULT_BINS):
+    """Distribution of every metric in the cohort, computed in vectorized passes."""
+    metric_ids, values = load_values(visit_ids)
+    if not len(values):
+        return []
+
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(metric_ids)) + 1))
+    counts = np.diff(np.append(starts, len(values)))
+    groups = np.repeat(np.arange(len(starts)), counts)
+    group_ids = metric_ids[starts]
+    names, bounds = metric_ranges(group_ids)
+
+    sums = np.add.reduceat(values, starts)
+    means = sums / counts
+    stds = np.sqrt(np.add.reduceat((values - means[groups]) ** 2, starts) / counts)
+    medians = quantiles(values, starts, counts, [50])[:, 0]
+    percentile_values = quantiles(values, starts, counts, percentiles)
+
+    with np.errstate(invalid='ignore'):
+        healthy = (values >= bounds[groups, 2]) & (values <= bounds[groups, 3])
+    healthy_shares = np.add.reduceat(healthy.astype(np.float64), starts) / counts
+    has_healthy_range = ~np.isnan(bounds[:, 2]) & ~np.isnan(bounds[:, 3])
+    has_total_range = ~np.isnan(bounds[:, 0]) & ~np.isnan(bounds[:, 1]) & (bounds[:, 1] > bounds[:, 0])
+    histogram_counts = histograms(values, groups, bounds, len(starts), bins)
+
+    results = []
+    for i, name in enumerate(names):
+        results.append({
+            'metricName': name,
+            'value': int(means[i]),
+            'count': int(counts[i]),
+            'mean': float(means[i]),
+            'median': float(medians[i]),
+            'std': float(stds[i]),
+            'percentiles': {
+                '{:g}'.format(q): float(percentile_values[i, j]) for j, q in enumerate(percentiles)
+            },
+            'histogram': None if not has_total_range[i] else {
+                'edges': np.linspace(bounds[i, 0], bounds[i, 1], bins + 1).tolist(),
+                'counts': histogram_counts[i].tolist()
+            },
+            'healthyShare': float(healthy_shares[i]) if has_healthy_range[i] else None
+        })
+    return results
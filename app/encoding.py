@@ -0,0 +1,71 @@
+import datetime
+import decimal
+import json
+import uuid
+
+from flask import Response
+from flask_api import renderers
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def default(obj):
+    # same output as Flask's JSONEncoder, clients parse these dates already
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return http_date(obj.timetuple())
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    raise TypeError('{!r} is not JSON serializable'.format(obj))
+
+
+def stdlib_dumps(obj):
+    return json.dumps(obj, default=default, separators=(',', ':')).encode('utf-8')
+
+
+def orjson_dumps(obj):
+    return orjson.dumps(obj, default=default, option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+
+
+ENCODERS = {
+    'stdlib': stdlib_dumps,
+    'orjson': orjson_dumps,
+}
+
+
+class Encoder(object):
+    """Response encoder, orjson when it is installed and the stdlib otherwise."""
+
+    def __init__(self):
+        self.dumps = orjson_dumps if orjson is not None else stdlib_dumps
+
+    def configure(self, name):
+        if name == 'auto':
+            name = 'orjson' if orjson is not None else 'stdlib'
+        if name == 'orjson' and orjson is None:
+            raise RuntimeError('JSON_ENCODER is orjson but orjson is not installed')
+        self.dumps = ENCODERS[name]
+
+
+encoder = Encoder()
+
+
+def dumps(obj):
+    return encoder.dumps(obj)
+
+
+def jsonify(obj):
+    return Response(encoder.dumps(obj), mimetype='application/json')
+
+
+class JSONRenderer(renderers.JSONRenderer):
+    """Renders the plain values views return, e.g. `{}, 400`, with the
+    configured encoder (see DEFAULT_RENDERERS)."""
+
+    def render(self, data, media_type, **options):
+        return encoder.dumps(data)
@@ -0,0 +1,59 @@
+from sqlalchemy import event, inspect
+
+from app import aggregates, scores
+from app.models import Exam
+
+# the exam columns the derived data depends on
+FIELDS = ('visit_id', 'metric_id', 'value')
+
+
+def exam_change(target):
+    """(old, new) (visit_id, metric_id, value) of an updated exam, None
+    when the update left them alone."""
+    state = inspect(target)
+    old = []
+    new = []
+    for key in FIELDS:
+        history = state.attrs[key].history
+        new.append(getattr(target, key))
+        old.append(history.deleted[0] if history.deleted else new[-1])
+    if old == new:
+        return None
+    return tuple(old), tuple(new)
+
+
+def apply(connection, visit_id, metric_id, value, sign):
+    """Adds (sign=1) or removes (sign=-1) an exam value from the aggregates and its visit's score."""
+    aggregates.add_value(connection, visit_id, metric_id, value, sign)
+    scores.apply(connection, visit_id, metric_id, value, sign)
+
+
+def exam_inserted(mapper, connection, target):
+    apply(connection, target.visit_id, target.metric_id, target.value, 1)
+
+
+def exam_deleted(mapper, connection, target):
+    apply(connection, target.visit_id, target.metric_id, target.value, -1)
+
+
+def exam_updated(mapper, connection, target):
+    change = exam_change(target)
+    if change is None:
+        return
+    old, new = change
+    apply(connection, *old, sign=-1)
+    apply(connection, *new, sign=1)
+
+
+LISTENERS = (
+    ('after_insert', exam_inserted),
+    ('after_delete', exam_deleted),
+    ('after_update', exam_updated),
+)
+
+
+def listen():
+    """Registers the Exam listeners, once however many apps are created."""
+    for identifier, listener in LISTENERS:
+        if not event.contains(Exam, identifier, listener):
+            event.listen(Exam, identifier, listener)
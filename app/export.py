@@ -0,0 +1,57 @@
+import csv
+import io
+
+from sqlalchemy import select
+
+from app import db
+from app.models import Exam, Visit, User, Metric
+
+CHUNK_SIZE = 10000
+
+COLUMNS = (
+    ('exam_id', Exam.id),
+    ('value', Exam.value),
+    ('exam_date_created', Exam.date_created),
+    ('exam_date_modified', Exam.date_modified),
+    ('metric_id', Exam.metric_id),
+    ('metric_name', Metric.name),
+    ('metric_unit_label', Metric.unit_label),
+    ('visit_id', Visit.id),
+    ('visit_date_created', Visit.date_created),
+    ('user_id', User.id),
+    ('user_gender', User.gender),
+    ('user_birth_date', User.birth_date),
+)
+
+
+def export_statement():
+    return select([column.label(name) for name, column in COLUMNS]).select_from(
+        Exam.__table__.join(Metric.__table__).join(Visit.__table__).join(User.__table__)
+    ).order_by(Exam.id)
+
+
+def csv_chunks(chunk_size=CHUNK_SIZE):
+    """Yields the export as CSV text, `chunk_size` rows at a time.
+
+    Rows come from a server-side cursor as plain tuples, so memory stays
+    bounded whatever the size of the exams table.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in COLUMNS])
+
+    result = db.session.execute(export_statement().execution_options(stream_results=True))
+    try:
+        while True:
+            rows = result.fetchmany(chunk_size)
+            if not rows:
+                break
+            writer.writerows(rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    finally:
+        result.close()
+
+    if buffer.tell():
+        yield buffer.getvalue()
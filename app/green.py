@@ -0,0 +1,26 @@
+import psycopg2
+from psycopg2 import extensions
+
+
+def patch_psycopg():
+    """Make psycopg2 yield to the gevent hub while it waits on the server.
+
+    Without the wait callback every query blocks the whole worker, which
+    defeats the point of running gevent workers.
+    """
+    extensions.set_wait_callback(gevent_wait_callback)
+
+
+def gevent_wait_callback(conn, timeout=None):
+    from gevent.socket import wait_read, wait_write
+
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            break
+        elif state == extensions.POLL_READ:
+            wait_read(conn.fileno(), timeout=timeout)
+        elif state == extensions.POLL_WRITE:
+            wait_write(conn.fileno(), timeout=timeout)
+        else:
+            raise psycopg2.OperationalError('Bad result from poll: {!r}'.format(state))
@@ -0,0 +1,32 @@
+import hashlib
+
+from sqlalchemy.sql import func
+
+from app import db
+from app.models import Exam, Visit
+
+
+def history_etag(user_id):
+    """Strong ETag of the user's visits and exams.
+
+    Writes bump the visit's date_modified and deletes change the counts,
+    so one aggregate over the user's rows is enough to revalidate.
+    """
+    version = db.session.query(
+        func.max(Visit.date_modified), func.max(Exam.date_modified),
+        func.count(func.distinct(Visit.id)), func.count(Exam.id)
+    ).select_from(Visit).outerjoin(Visit.exams).filter(Visit.user_id == user_id).one()
+    key = '{}:{}:{}:{}:{}'.format(user_id, *version)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def metric_history(user_id):
+    """metric id -> [(visit date, value)] of the user, oldest first."""
+    rows = db.session.query(Exam.metric_id, Visit.date_created, Exam.value).join(Exam.visit).filter(
+        Visit.user_id == user_id
+    ).order_by(Exam.metric_id, Visit.date_created, Exam.id)
+
+    results = {}
+    for metric_id, date, value in rows:
+        results.setdefault(str(metric_id), []).append((date, value))
+    return results
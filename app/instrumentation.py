@@ -0,0 +1,111 @@
+import hmac
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from flask import g, request, has_request_context, Response
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.database import pool_status
+
+logger = logging.getLogger('app.slow_query')
+
+COUNTERS = (
+    ('requests_total', 'counter', 'Requests served'),
+    ('request_seconds_sum', 'counter', 'Wall time spent in the handler'),
+    ('sql_statements_total', 'counter', 'SQL statements executed'),
+    ('sql_seconds_sum', 'counter', 'Time spent in SQL statements'),
+    ('response_bytes_sum', 'counter', 'Response body bytes'),
+)
+
+
+class Instrumentation(object):
+    """Per route timings, SQL counts and response sizes.
+
+    Every response gets a Server-Timing header and, when
+    METRICS_INTERNAL_TOKEN is set, the totals of the worker are exposed
+    at /metrics-internal in the Prometheus text format to requests with
+    `Authorization: Bearer <token>`. Statements slower than SLOW_QUERY_MS
+    are logged with their route.
+    """
+
+    def __init__(self):
+        self.slow_query = None
+        self.db = None
+        self.token = None
+        self._stats = defaultdict(lambda: defaultdict(float))
+        self._lock = threading.Lock()
+
+    def init_app(self, app, db):
+        self.slow_query = app.config['SLOW_QUERY_MS'] / 1000.0
+        self.db = db
+        self.token = app.config['METRICS_INTERNAL_TOKEN']
+        if not event.contains(Engine, 'before_cursor_execute', self.before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', self.before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self.after_cursor_execute)
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+        if self.token:
+            app.add_url_rule('/metrics-internal', 'metrics_internal', self.metrics_view)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info['query_start'].pop()
+        route = None
+        if has_request_context() and 'request_start' in g:
+            g.sql_statements += 1
+            g.sql_seconds += duration
+            route = request.endpoint
+        if self.slow_query and duration >= self.slow_query:
+            logger.warning('slow query %.1fms route=%s: %s', duration * 1000, route, statement)
+
+    def before_request(self):
+        g.request_start = time.perf_counter()
+        g.sql_statements = 0
+        g.sql_seconds = 0.0
+
+    def after_request(self, response):
+        if 'request_start' not in g:
+            return response
+        wall = time.perf_counter() - g.request_start
+        size = 0 if response.is_streamed else response.calculate_content_length() or 0
+        response.headers['Server-Timing'] = 'app;dur={:.1f}, db;dur={:.1f};desc="{} queries"'.format(
+            wall * 1000, g.sql_seconds * 1000, g.sql_statements
+        )
+
+        with self._lock:
+            stats = self._stats[request.endpoint or 'unknown']
+            stats['requests_total'] += 1
+            stats['request_seconds_sum'] += wall
+            stats['sql_statements_total'] += g.sql_statements
+            stats['sql_seconds_sum'] += g.sql_seconds
+            stats['response_bytes_sum'] += size
+        return response
+
+    def metrics_view(self):
+        expected = 'Bearer {}'.format(self.token).encode('utf-8')
+        if not hmac.compare_digest(request.headers.get('Authorization', '').encode('utf-8'), expected):
+            return Response(status=401)
+
+        lines = []
+        with self._lock:
+            for name, kind, description in COUNTERS:
+                lines.append('# HELP api_{} {}'.format(name, description))
+                lines.append('# TYPE api_{} {}'.format(name, kind))
+                for route, stats in sorted(self._stats.items()):
+                    lines.append('api_{}{{route="{}"}} {}'.format(name, route, stats[name]))
+
+        for key, value in sorted(pool_status(self.db.engine).items()):
+            if key == 'pool':
+                continue
+            lines.append('# TYPE api_db_pool_{} gauge'.format(key))
+            lines.append('api_db_pool_{} {}'.format(key, value))
+
+        return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+
+instrumentation = Instrumentation()
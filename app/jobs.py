@@ -0,0 +1,147 @@
+import datetime
+import hashlib
+import json
+import logging
+import threading
+
+from sqlalchemy import select, or_, and_
+from sqlalchemy.sql import func
+
+from app import db
+from app.encoding import dumps
+from app.models import Job
+from app.statistics import exam_statistics
+from app.unit_of_work import unit_of_work
+
+logger = logging.getLogger('app.jobs')
+
+# kind -> function of the JSON params returning the JSON result
+HANDLERS = {
+    'statistics': exam_statistics,
+}
+
+
+def params_hash(kind, params):
+    return hashlib.sha1(json.dumps([kind, params], sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class JobQueue(object):
+    """Runs long requests in the background, queued in the jobs table.
+
+    `manage.py run_jobs` threads (and JOB_WORKERS threads in every web
+    worker, 0 by default) claim queued rows with FOR UPDATE SKIP LOCKED,
+    so any number of processes share the queue without a broker. A job's
+    statements are bounded by JOB_STATEMENT_TIMEOUT instead of the
+    request statement timeout. A pending job with the same kind and
+    params, or one finished less than JOB_RESULT_TTL seconds ago, is
+    reused instead of queueing another. Jobs running for more than
+    JOB_TIMEOUT seconds are taken as lost with their process and claimed
+    again.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.workers = 0
+        self.result_ttl = 300
+        self.timeout = 3600
+        self.poll_interval = 2.0
+        self.statement_timeout = 0
+        self._threads = []
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        self.workers = app.config['JOB_WORKERS']
+        self.result_ttl = app.config['JOB_RESULT_TTL']
+        self.timeout = app.config['JOB_TIMEOUT']
+        self.poll_interval = app.config['JOB_POLL_INTERVAL']
+        self.statement_timeout = app.config['JOB_STATEMENT_TIMEOUT']
+        # threads don't survive a fork, start them in the worker
+        app.before_first_request(self.start)
+
+    def enqueue(self, kind, params, user_id):
+        digest = params_hash(kind, params)
+        fresh = func.current_timestamp() - datetime.timedelta(seconds=self.result_ttl)
+        job = Job.query.filter(Job.kind == kind, Job.params_hash == digest, or_(
+            Job.status.in_(('queued', 'running')),
+            and_(Job.status == 'done', Job.date_finished > fresh)
+        )).order_by(Job.id.desc()).first()
+        if job is not None:
+            return job
+
+        job = Job(
+            kind=kind, params=dumps(params).decode('utf-8'), params_hash=digest, status='queued', user_id=user_id
+        )
+        job.save()
+        unit_of_work.after_commit(self._wake.set)
+        return job
+
+    def claim(self):
+        jobs = Job.__table__
+        lost = func.current_timestamp() - datetime.timedelta(seconds=self.timeout)
+        candidate = select([jobs.c.id]).where(or_(
+            jobs.c.status == 'queued',
+            and_(jobs.c.status == 'running', jobs.c.date_started < lost)
+        )).order_by(jobs.c.id).limit(1).with_for_update(skip_locked=True)
+        row = db.session.execute(jobs.update().where(jobs.c.id == candidate.as_scalar()).values(
+            status='running', date_started=func.current_timestamp()
+        ).returning(jobs.c.id, jobs.c.kind, jobs.c.params)).first()
+        db.session.commit()
+        return row
+
+    def execute(self, row):
+        jobs = Job.__table__
+        try:
+            # lasts until the commit below, 0 lifts the limit
+            db.session.execute('SET LOCAL statement_timeout = {:d}'.format(self.statement_timeout))
+            result = HANDLERS[row.kind](json.loads(row.params))
+            values = {'status': 'done', 'result': dumps(result).decode('utf-8')}
+        except Exception as error:
+            logger.exception('job %s (%s) failed', row.id, row.kind)
+            db.session.rollback()
+            values = {'status': 'failed', 'error': str(error) or type(error).__name__}
+        db.session.execute(jobs.update().where(jobs.c.id == row.id).values(
+            date_finished=func.current_timestamp(), **values
+        ))
+        db.session.commit()
+
+    def work(self):
+        with self.app.app_context():
+            while True:
+                try:
+                    row = self.claim()
+                    if row is not None:
+                        self.execute(row)
+                except Exception:
+                    # e.g. a lost connection, a job left running is
+                    # claimed again after JOB_TIMEOUT
+                    logger.exception('job worker iteration failed')
+                    db.session.rollback()
+                    row = None
+                finally:
+                    db.session.remove()
+                if row is None:
+                    self._wake.wait(self.poll_interval)
+                    self._wake.clear()
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self.work, name='job-worker-{}'.format(i))
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def run(self, workers=None):
+        """Works in the foreground until interrupted."""
+        if workers is not None:
+            self.workers = workers
+        self.start()
+        for thread in self._threads:
+            thread.join()
+
+
+job_queue = JobQueue()
@@ -1,9 +1,28 @@
 from app import db
-from werkzeug.security import generate_password_hash, check_password_hash
+from app.cache import catalog_cache
+from app.unit_of_work import unit_of_work
+from app.passwords import password_hasher
 
+# bounds of a Postgres integer column
+INT_MIN = -2 ** 31
+INT_MAX = 2 ** 31 - 1
 
-class Exam(db.Model):
+
+class Model(object):
+    """save() and delete() enlist the instance in the request's unit of work."""
+
+    def save(self):
+        unit_of_work.add(self)
+
+    def delete(self):
+        unit_of_work.delete(self)
+
+
+class Exam(Model, db.Model):
     __tablename__ = 'exams'
+    __table_args__ = (
+        db.Index('ix_exams_visit_id_metric_id', 'visit_id', 'metric_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     value = db.Column(db.Integer)
@@ -13,9 +32,9 @@ class Exam(db.Model):
         default=db.func.current_timestamp(),
         onupdate=db.func.current_timestamp()
     )
-    visit_id = db.Column(db.Integer, db.ForeignKey('visits.id'), nullable=False)
+    visit_id = db.Column(db.Integer, db.ForeignKey('visits.id', ondelete='CASCADE'), nullable=False)
     visit = db.relationship('Visit', back_populates='exams')
-    metric_id = db.Column(db.Integer, db.ForeignKey('metrics.id'), nullable=False)
+    metric_id = db.Column(db.Integer, db.ForeignKey('metrics.id', ondelete='CASCADE'), nullable=False, index=True)
     metric = db.relationship('Metric', back_populates='exams')
 
     def __init__(self, metric, value, visit):
@@ -23,52 +42,83 @@ class Exam(db.Model):
         self.value = value
         self.visit = visit
 
-    def save(self):
-        db.session.add(self)
-        db.session.commit()
-
     @staticmethod
     def get_all():
         return Exam.query.all()
 
-    def delete(self):
-        db.session.delete(self)
-        db.session.commit()
+    @staticmethod
+    def parse_value(value):
+        """A request's exam value as the integer column stores it.
+
+        Numbers are rounded half to even like Postgres casts them, strings
+        must hold an integer and None stays None. Anything else raises
+        ValueError, as the INSERT would fail.
+        """
+        if value is None:
+            return None
+        if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+            raise ValueError(value)
+        try:
+            value = int(value) if isinstance(value, str) else int(round(value))
+        except OverflowError:
+            raise ValueError(value)
+        if not INT_MIN <= value <= INT_MAX:
+            raise ValueError(value)
+        return value
+
+    @staticmethod
+    def insert_many(rows):
+        # one multi-row INSERT, returned rows follow the order of `rows`
+        table = Exam.__table__
+        return db.session.execute(
+            table.insert().values(rows).returning(table.c.id, table.c.date_created, table.c.date_modified)
+        ).fetchall()
 
 
-class Visit(db.Model):
+class Visit(Model, db.Model):
     __tablename__ = 'visits'
+    __table_args__ = (
+        db.Index('ix_visits_user_id_date_modified', 'user_id', 'date_modified'),
+        db.Index('ix_visits_user_id_health_score', 'user_id', 'health_score'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255))
-    date_created = db.Column(db.DateTime, default=db.func.current_timestamp())
+    date_created = db.Column(db.DateTime, default=db.func.current_timestamp(), index=True)
     date_modified = db.Column(
         db.DateTime,
         default=db.func.current_timestamp(),
         onupdate=db.func.current_timestamp()
     )
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    user = db.relationship('User', backref=db.backref('visits', lazy=True))
-    exams = db.relationship('Exam', back_populates='visit', cascade='all, delete-orphan')
+    # weighted points of the exams, kept up to date by app.scores
+    score_sum = db.Column(db.Float, nullable=False, default=0, server_default='0')
+    score_weight = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    health_score = db.Column(db.Float, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    user = db.relationship('User', backref=db.backref(
+        'visits', lazy=True, cascade='all, delete-orphan', passive_deletes=True
+    ))
+    # the database deletes the exams, see app.aggregates and app.scores
+    exams = db.relationship('Exam', back_populates='visit', cascade='all, delete-orphan', passive_deletes=True)
 
     def __init__(self, name, user):
         self.name = name
         self.user = user
 
-    def save(self):
-        db.session.add(self)
-        db.session.commit()
-
     @staticmethod
     def get_all():
         return Visit.query.all()
 
-    def delete(self):
-        db.session.delete(self)
-        db.session.commit()
+    @staticmethod
+    def touch(visit_id):
+        # bumps date_modified in SQL, without loading the visit
+        Visit.query.filter_by(id=visit_id).update(
+            {Visit.date_modified: db.func.current_timestamp()}, synchronize_session=False
+        )
+        unit_of_work.mark()
 
 
-class User(db.Model):
+class User(Model, db.Model):
     __tablename__ = 'users'
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(32), unique=True)
@@ -90,22 +140,17 @@ class User(db.Model):
         self.gender = gender
         self.birth_date = birth_date
 
-    def save(self):
-        db.session.add(self)
-        db.session.commit()
-
     def hash_password(self, password):
-        self.password_hash = generate_password_hash(password, method='sha256')
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.check(self.password_hash, password)
 
-    @staticmethod
-    def get_all():
-        return User.query.order_by(User.username).all()
+    def password_needs_rehash(self):
+        return password_hasher.needs_rehash(self.password_hash)
 
 
-class Metric(db.Model):
+class Metric(Model, db.Model):
     __tablename__ = 'metrics'
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255))
@@ -115,10 +160,10 @@ class Metric(db.Model):
     total_range_max = db.Column(db.Integer)
     healthy_range_min = db.Column(db.Integer)
     healthy_range_max = db.Column(db.Integer)
-    gender = db.Column(db.String(255))
-    category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=True)
+    gender = db.Column(db.String(255), index=True)
+    category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=True, index=True)
     category = db.relationship('Category', back_populates='metrics')
-    exams = db.relationship('Exam', back_populates='metric', cascade='all, delete-orphan')
+    exams = db.relationship('Exam', back_populates='metric', cascade='all, delete-orphan', passive_deletes=True)
 
     def __init__(self, name, weight, unit_label, total_range_min, total_range_max, healthy_range_min,
                  healthy_range_max, gender):
@@ -132,19 +177,19 @@ class Metric(db.Model):
         self.gender = gender
 
     def save(self):
-        db.session.add(self)
-        db.session.commit()
+        super(Metric, self).save()
+        unit_of_work.after_commit(catalog_cache.invalidate)
 
     def delete(self):
-        db.session.delete(self)
-        db.session.commit()
+        super(Metric, self).delete()
+        unit_of_work.after_commit(catalog_cache.invalidate)
 
     @staticmethod
     def get_all():
         return Metric.query.all()
 
 
-class Category(db.Model):
+class Category(Model, db.Model):
     __tablename__ = 'categories'
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255))
@@ -154,13 +199,68 @@ class Category(db.Model):
         self.name = name
 
     def save(self):
-        db.session.add(self)
-        db.session.commit()
+        super(Category, self).save()
+        unit_of_work.after_commit(catalog_cache.invalidate)
 
     def delete(self):
-        db.session.delete(self)
-        db.session.commit()
+        super(Category, self).delete()
+        unit_of_work.after_commit(catalog_cache.invalidate)
 
     @staticmethod
     def get_all():
         return Category.query.all()
+
+
+class MetricAggregate(db.Model):
+    # keyed by the full birth date, so there is about one row per user and
+    # metric: cohort queries filter on it without joining the users and
+    # visits, but the table is not much smaller than the exams
+    __tablename__ = 'metric_aggregates'
+    metric_id = db.Column(db.Integer, db.ForeignKey('metrics.id', ondelete='CASCADE'), primary_key=True)
+    gender = db.Column(db.String(255), primary_key=True)
+    birth_date = db.Column(db.DateTime, primary_key=True)
+    value_sum = db.Column(db.BigInteger, nullable=False, default=0)
+    value_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class Job(Model, db.Model):
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        db.Index('ix_jobs_status_id', 'status', 'id'),
+        db.Index('ix_jobs_kind_params_hash', 'kind', 'params_hash'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(64), nullable=False)
+    # JSON, params_hash finds finished jobs with the same params
+    params = db.Column(db.Text, nullable=False)
+    params_hash = db.Column(db.String(40), nullable=False)
+    # queued, running, done or failed
+    status = db.Column(db.String(16), nullable=False, default='queued')
+    result = db.Column(db.Text)
+    error = db.Column(db.Text)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    date_created = db.Column(db.DateTime, default=db.func.current_timestamp())
+    date_started = db.Column(db.DateTime)
+    date_finished = db.Column(db.DateTime)
+
+
+class Deletion(Model, db.Model):
+    __tablename__ = 'deletions'
+
+    id = db.Column(db.Integer, primary_key=True)
+    # metric, visit or user
+    kind = db.Column(db.String(16), nullable=False)
+    target_id = db.Column(db.Integer, nullable=False)
+    # queued, running, done or failed
+    status = db.Column(db.String(16), nullable=False, default='queued')
+    deleted = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    # kept when the user is deleted, possibly by this deletion
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'))
+    date_created = db.Column(db.DateTime, default=db.func.current_timestamp())
+    date_modified = db.Column(
+        db.DateTime,
+        default=db.func.current_timestamp(),
+        onupdate=db.func.current_timestamp()
+    )
@@ -0,0 +1,161 @@
+import base64
+import datetime
+import json as stdlib_json
+from urllib.parse import urlencode
+
+from flask import request, Response, stream_with_context
+from sqlalchemy import tuple_
+
+from app import db
+from app.encoding import dumps, jsonify
+
+MAX_LIMIT = 1000
+STREAM_CHUNK_SIZE = 1000
+STREAM_MIMETYPES = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson'
+}
+
+
+def encode_cursor(values):
+    values = [value.isoformat() if isinstance(value, datetime.datetime) else value for value in values]
+    return base64.urlsafe_b64encode(stdlib_json.dumps(values).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, columns):
+    try:
+        values = stdlib_json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        if not isinstance(values, list) or len(values) != len(columns):
+            return None
+        values = [coerce(value, column.type) for value, column in zip(values, columns)]
+    except (ValueError, TypeError, UnicodeError):
+        return None
+    return values
+
+
+def coerce(value, type_):
+    """A JSON cursor value as its keyset column's type, ValueError when it isn't one."""
+    if value is None:
+        return None
+    if isinstance(type_, db.DateTime):
+        return parse_datetime(value)
+    if isinstance(value, bool):
+        raise ValueError(value)
+    if isinstance(type_, db.Integer):
+        if not isinstance(value, int):
+            raise ValueError(value)
+        return value
+    if isinstance(type_, db.Numeric):
+        if not isinstance(value, (int, float)):
+            raise ValueError(value)
+        return float(value)
+    if isinstance(type_, db.String) and not isinstance(value, str):
+        raise ValueError(value)
+    return value
+
+
+def parse_datetime(value):
+    try:
+        return datetime.datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.%f')
+    except ValueError:
+        return datetime.datetime.strptime(value, '%Y-%m-%dT%H:%M:%S')
+
+
+def after(columns, values):
+    if len(columns) == 1:
+        return columns[0] > values[0]
+    return tuple_(*columns) > tuple_(*values)
+
+
+def next_link(cursor):
+    args = request.args.copy()
+    args['cursor'] = cursor
+    return '<{}?{}>; rel="next"'.format(request.base_url, urlencode(list(args.items(multi=True))))
+
+
+def list_response(query, keyset, schema, filters=(), joins=()):
+    """Serializes a list endpoint query.
+
+    Without `limit`, `cursor` or `stream` the whole list is returned as
+    before. `limit`/`cursor` return one keyset page ordered by `keyset`,
+    with a `Link` header to the next one. `stream=json|ndjson` writes the
+    rows in chunks from a server-side cursor.
+
+    The schema's `columns` are read as row tuples ending with the keyset
+    values, `fields=a,b` selects just some of them. `filters` and
+    `keyset` may use the columns of the schema's joins when `joins` lists
+    their relationships.
+    """
+    columns = schema.parse_fields(request.args.get('fields'))
+    if columns is None:
+        return {}, 400
+    query = schema.rows(query, *keyset, columns=columns, joins=joins).filter(*filters).order_by(*keyset)
+
+    def dump(row):
+        return schema.dump_row(row, columns)
+
+    cursor = request.args.get('cursor')
+    if cursor is not None:
+        values = decode_cursor(cursor, keyset)
+        if values is None:
+            return {}, 400
+        query = query.filter(after(keyset, values))
+
+    limit = request.args.get('limit', type=int)
+    if limit is not None:
+        if limit < 1:
+            return {}, 400
+        query = query.limit(min(limit, MAX_LIMIT))
+
+    stream = request.args.get('stream')
+    if stream is not None:
+        if stream not in STREAM_MIMETYPES:
+            return {}, 400
+        return stream_response(query, dump, stream)
+
+    rows = query.all()
+    response = jsonify([dump(row) for row in rows])
+    if limit is not None and rows and len(rows) == min(limit, MAX_LIMIT):
+        response.headers['Link'] = next_link(encode_cursor(list(rows[-1][-len(keyset):])))
+    response.status_code = 200
+    return response
+
+
+def detail_response(query, schema):
+    """Serializes the one row of `query`, 404 when there is none, with the
+    `fields=a,b` of list_response."""
+    columns = schema.parse_fields(request.args.get('fields'))
+    if columns is None:
+        return {}, 400
+    row = schema.rows(query, columns=columns).first()
+    if row is None:
+        return {}, 404
+    response = jsonify(schema.dump_row(row, columns))
+    response.status_code = 200
+    return response
+
+
+def stream_response(query, dump, stream):
+    rows = query.execution_options(stream_results=True).yield_per(STREAM_CHUNK_SIZE)
+
+    def generate():
+        if stream == 'json':
+            yield '['
+        separator = ',' if stream == 'json' else '\n'
+        chunk = []
+        written = False
+        for obj in rows:
+            chunk.append(dumps(dump(obj)).decode('utf-8'))
+            if len(chunk) == STREAM_CHUNK_SIZE:
+                yield (separator if written else '') + separator.join(chunk)
+                written = True
+                chunk = []
+        if chunk:
+            yield (separator if written else '') + separator.join(chunk)
+            written = True
+        if stream == 'json':
+            yield ']'
+        elif written:
+            yield '\n'
+
+    return Response(stream_with_context(generate()), mimetype=STREAM_MIMETYPES[stream])
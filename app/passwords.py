@@ -0,0 +1,98 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+EXECUTORS = ('auto', 'process', 'thread')
+
+
+class HasherBusy(Exception):
+    pass
+
+
+def gevent_patched():
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+
+class PasswordHasher(object):
+    """Hashes passwords away from the worker serving the request.
+
+    pbkdf2 is CPU bound, so a thread of the worker would hold its GIL and,
+    under gevent, its hub. `executor='process'` hashes in a pool of
+    `workers` processes per web worker. Under gevent 'auto' uses a gevent
+    thread pool instead, whose native threads hash while the hub keeps
+    serving the other requests (hashlib releases the GIL in pbkdf2), and
+    processes otherwise. 'thread' is the in-process pool, for comparison
+    with `manage.py benchmark_login`.
+
+    At most `workers` hashes run at the same time and at most `queue_size`
+    wait for a slot; further calls raise HasherBusy instead of tying up
+    the worker, so a login storm can't starve the rest of the API.
+    """
+
+    def __init__(self, method='pbkdf2:sha256:150000', workers=2, queue_size=16, timeout=5, executor='auto'):
+        self.configure(method, workers, queue_size, timeout, executor)
+
+    def configure(self, method, workers, queue_size, timeout, executor='auto'):
+        if executor not in EXECUTORS:
+            raise ValueError('unknown password hash executor {!r}'.format(executor))
+        self.method = method
+        self.timeout = timeout
+        self.workers = workers
+        self.executor = executor
+        self.shutdown()
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+
+    def shutdown(self):
+        pool = getattr(self, '_pool', None)
+        if pool is not None and self._pid == os.getpid():
+            if self._green:
+                pool.kill()
+            else:
+                pool.shutdown(wait=False)
+        self._pool = None
+        self._pid = None
+        self._green = False
+
+    def _get_pool(self):
+        # created in the process that hashes, never in a preloading master
+        if self._pool is None or self._pid != os.getpid():
+            self._green = self.executor == 'auto' and gevent_patched()
+            if self._green:
+                from gevent.threadpool import ThreadPool
+
+                self._pool = ThreadPool(self.workers)
+            elif self.executor == 'thread':
+                self._pool = ThreadPoolExecutor(max_workers=self.workers)
+            else:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            self._pid = os.getpid()
+        return self._pool
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise HasherBusy()
+        try:
+            pool = self._get_pool()
+            if self._green:
+                return pool.apply(fn, args)
+            return pool.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def check(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        return password_hash.split('$', 1)[0] != self.method
+
+
+password_hasher = PasswordHasher()
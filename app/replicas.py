@@ -0,0 +1,112 @@
+import logging
+import random
+import threading
+import time
+
+from flask import g, request
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.cache import BACKENDS
+
+logger = logging.getLogger('app.replicas')
+
+READ_METHODS = ('GET', 'HEAD')
+LAG_CHECK_INTERVAL = 1.0
+
+# seconds the replica is behind, 0 when it replayed all it received
+LAG_QUERY = text(
+    'SELECT CASE WHEN NOT pg_is_in_recovery() THEN 0 '
+    'WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END'
+)
+
+
+class ReplicaRouter(object):
+    """Sends the reads of GET requests to a read replica.
+
+    Every SQLALCHEMY_REPLICA_URIS entry becomes a `replica_<n>` bind.
+    A GET request reads from a random replica lagging less than
+    SQLALCHEMY_REPLICA_MAX_LAG seconds, or from the primary when there is
+    none. After a successful write a user reads from the primary for
+    SQLALCHEMY_REPLICA_STICKY seconds, so they see their own writes.
+    Flushes and DML always go to the primary, see RoutingSession.
+
+    The sticky marks must reach every worker, so replicas are only used
+    with a shared CACHE_BACKEND.
+    """
+
+    def __init__(self):
+        self.db = None
+        self.app = None
+        self.keys = ()
+        self.max_lag = 0
+        self.sticky = None
+        self._lags = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app, db):
+        self.db = db
+        self.app = app
+        self.max_lag = app.config['SQLALCHEMY_REPLICA_MAX_LAG']
+        self.keys = []
+        if app.config['SQLALCHEMY_REPLICA_URIS'] and app.config['CACHE_BACKEND'] == 'local':
+            logger.warning('read replicas need a shared CACHE_BACKEND, reading from the primary')
+            return
+
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        for i, uri in enumerate(app.config['SQLALCHEMY_REPLICA_URIS']):
+            key = 'replica_{}'.format(i)
+            binds[key] = uri
+            self.keys.append(key)
+        if not self.keys:
+            return
+
+        app.config['SQLALCHEMY_BINDS'] = binds
+        config = dict(app.config, CACHE_TTL=app.config['SQLALCHEMY_REPLICA_STICKY'])
+        self.sticky = BACKENDS[app.config['CACHE_BACKEND']](config)
+        app.after_request(self.after_request)
+
+    def engines(self):
+        return {key: self.db.get_engine(self.app, bind=key) for key in self.keys}
+
+    def lag(self, key):
+        now = time.monotonic()
+        with self._lock:
+            checked = self._lags.get(key)
+        if checked is not None and now - checked[1] < LAG_CHECK_INTERVAL:
+            return checked[0]
+
+        try:
+            with self.db.get_engine(self.app, bind=key).connect() as connection:
+                lag = float(connection.scalar(LAG_QUERY))
+        except SQLAlchemyError:
+            # unreachable replicas are skipped until the next check
+            lag = float('inf')
+        with self._lock:
+            self._lags[key] = (lag, now)
+        return lag
+
+    def route(self, user_id):
+        """Picks the bind of the current request's reads."""
+        g.replica_user = user_id
+        if not self.keys or request.method not in READ_METHODS:
+            return
+        if self.sticky.get('replica:sticky:{}'.format(user_id)) is not None:
+            return
+        healthy = [key for key in self.keys if self.lag(key) <= self.max_lag]
+        if healthy:
+            self.db.session.info['replica'] = random.choice(healthy)
+
+    def use_primary(self):
+        """Sends the rest of the request's reads to the primary."""
+        self.db.session.info.pop('replica', None)
+
+    def after_request(self, response):
+        user_id = g.get('replica_user')
+        if user_id is not None and request.method not in READ_METHODS and response.status_code < 400:
+            self.sticky.set('replica:sticky:{}'.format(user_id), '1')
+        return response
+
+
+replica_router = ReplicaRouter()
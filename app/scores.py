@@ -0,0 +1,126 @@
+from sqlalchemy import event, inspect, and_, case, cast, exists, literal, select
+from sqlalchemy.sql import func
+
+from app import db
+from app.models import Exam, Visit, Metric
+
+# a metric change that moves the existing exams' points
+SCORED_FIELDS = ('weight', 'total_range_min', 'total_range_max', 'healthy_range_min', 'healthy_range_max')
+
+
+def points(value, metrics):
+    """Points of an exam value, from 1 in the healthy range down to 0 at
+    the total range bound on its side (0 outside when that side has none)."""
+    low, high = metrics.c.healthy_range_min, metrics.c.healthy_range_max
+    return case([
+        (and_(value >= low, value <= high), literal(1.0, db.Float)),
+        (value < low, func.greatest(0, 1 - cast(low - value, db.Float) / func.nullif(
+            low - metrics.c.total_range_min, 0))),
+    ], else_=func.greatest(0, 1 - cast(value - high, db.Float) / func.nullif(
+        metrics.c.total_range_max - high, 0)))
+
+
+def scored(value, metrics):
+    """Exams count when they have a value and their metric a healthy range and a weight."""
+    return and_(
+        value.isnot(None), metrics.c.healthy_range_min.isnot(None), metrics.c.healthy_range_max.isnot(None),
+        metrics.c.weight > 0
+    )
+
+
+def score(score_sum, score_weight):
+    return 100 * score_sum / func.nullif(score_weight, 0)
+
+
+def apply(connection, visit_id, metric_id, value, sign):
+    """Adds (sign=1) or removes (sign=-1) an exam value from its visit's score."""
+    if value is None:
+        return
+    visits = Visit.__table__
+    metrics = Metric.__table__
+    value = literal(Exam.parse_value(value), db.Integer)
+    delta_sum = sign * metrics.c.weight * points(value, metrics)
+    delta_weight = sign * metrics.c.weight
+    connection.execute(visits.update().where(and_(
+        visits.c.id == visit_id, metrics.c.id == metric_id, scored(value, metrics)
+    )).values(
+        score_sum=visits.c.score_sum + delta_sum,
+        score_weight=visits.c.score_weight + delta_weight,
+        health_score=score(visits.c.score_sum + delta_sum, visits.c.score_weight + delta_weight)
+    ))
+
+
+def add_many(connection, rows):
+    """Recomputes the visits of a multi-row INSERT in one statement."""
+    recompute(connection, sorted(set(row['visit_id'] for row in rows)))
+
+
+def totals(condition=None):
+    """score_sum and score_weight of the exams matching `condition`, by visit."""
+    exams = Exam.__table__
+    metrics = Metric.__table__
+    is_scored = scored(exams.c.value, metrics)
+    statement = select([
+        exams.c.visit_id,
+        func.coalesce(func.sum(case([(is_scored, metrics.c.weight * points(exams.c.value, metrics))], else_=0)),
+                      0).label('score_sum'),
+        func.coalesce(func.sum(case([(is_scored, metrics.c.weight)], else_=0)), 0).label('score_weight'),
+    ]).select_from(exams.join(metrics, metrics.c.id == exams.c.metric_id)).group_by(exams.c.visit_id)
+    if condition is not None:
+        statement = statement.where(condition)
+    return statement.alias('totals')
+
+
+def recompute(connection, visit_ids=None):
+    """Recomputes the scores of `visit_ids` (a list or a select, all visits
+    when None) with one set-based UPDATE from the exams."""
+    visits = Visit.__table__
+    exams = Exam.__table__
+    visit_totals = totals(None if visit_ids is None else exams.c.visit_id.in_(visit_ids))
+
+    connection.execute(visits.update().where(visits.c.id == visit_totals.c.visit_id).values(
+        score_sum=visit_totals.c.score_sum,
+        score_weight=visit_totals.c.score_weight,
+        health_score=score(visit_totals.c.score_sum, visit_totals.c.score_weight)
+    ))
+    # visits left without exams
+    empty = ~exists().where(exams.c.visit_id == visits.c.id)
+    if visit_ids is not None:
+        empty = and_(visits.c.id.in_(visit_ids), empty)
+    connection.execute(visits.update().where(empty).where(visits.c.score_weight != 0).values(
+        score_sum=0, score_weight=0, health_score=None
+    ))
+
+
+def subtract(connection, condition):
+    """Takes the exams matching `condition` out of their visits' scores.
+
+    Called before DELETE statements and ON DELETE CASCADE, which bypass
+    app.events."""
+    visits = Visit.__table__
+    removed = totals(condition)
+    score_sum = visits.c.score_sum - removed.c.score_sum
+    score_weight = visits.c.score_weight - removed.c.score_weight
+    connection.execute(visits.update().where(visits.c.id == removed.c.visit_id).values(
+        score_sum=score_sum, score_weight=score_weight, health_score=score(score_sum, score_weight)
+    ))
+
+
+def rebuild():
+    recompute(db.session.connection())
+    db.session.commit()
+
+
+@event.listens_for(Metric, 'after_update')
+def metric_updated(mapper, connection, target):
+    state = inspect(target)
+    if not any(state.attrs[key].history.has_changes() for key in SCORED_FIELDS):
+        return
+    exams = Exam.__table__
+    recompute(connection, select([exams.c.visit_id]).where(exams.c.metric_id == target.id).distinct())
+
+
+@event.listens_for(Metric, 'before_delete')
+def metric_deleted(mapper, connection, target):
+    # its exams go with ON DELETE CASCADE
+    subtract(connection, Exam.__table__.c.metric_id == target.id)
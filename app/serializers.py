@@ -0,0 +1,273 @@
+import json
+
+from sqlalchemy.orm import joinedload
+
+from app import classification
+from app.models import Exam, Visit, User, Metric, Category
+
+
+class Schema(object):
+    """Turns model instances into response dicts.
+
+    Schemas with `columns` serialize read-only lists from plain row
+    tuples, selecting just those columns and building no ORM objects,
+    and a `fields=` subset of them joins only the tables it needs. The
+    others list the loader options their dump() needs, so a list runs a
+    fixed number of queries whatever its size.
+    """
+    options = ()
+    # (key, column) pairs, in the order of dump()'s keys
+    columns = ()
+    # key -> relationship to outer join for a column of another table
+    joins = {}
+
+    def query(self, query):
+        return query.options(*self.options)
+
+    def parse_fields(self, value):
+        """The columns named by a `fields` parameter, all of them when it is
+        missing and None when it names an unknown field."""
+        if value is None:
+            return self.columns
+        keys = set(key for key in value.split(',') if key)
+        columns = tuple((key, column) for key, column in self.columns if key in keys)
+        if not columns or len(columns) != len(keys):
+            return None
+        return columns
+
+    def rows(self, query, *extra, columns=None, joins=()):
+        """Selects `columns` (all by default) followed by `extra`, e.g. the
+        keyset columns. `joins` are relationships the caller's filters need."""
+        columns = self.columns if columns is None else columns
+        joined = set()
+        for relationship in list(joins) + [self.joins.get(key) for key, _ in columns]:
+            if relationship is not None and relationship.key not in joined:
+                joined.add(relationship.key)
+                query = query.outerjoin(relationship)
+        return query.with_entities(
+            *([column.label(key) for key, column in columns] +
+              [column.label('extra_{}'.format(i)) for i, column in enumerate(extra)])
+        )
+
+    def dump_row(self, row, columns=None):
+        columns = self.columns if columns is None else columns
+        return {key: value for (key, _), value in zip(columns, row)}
+
+    def dump_rows(self, rows, columns=None):
+        return [self.dump_row(row, columns) for row in rows]
+
+    def dump(self, obj):
+        raise NotImplementedError
+
+    def dump_many(self, objs):
+        return [self.dump(obj) for obj in objs]
+
+
+class ExamSchema(Schema):
+    columns = (
+        ('id', Exam.id),
+        ('value', Exam.value),
+        ('dateCreated', Exam.date_created),
+        ('dateModified', Exam.date_modified),
+        ('visitId', Exam.visit_id),
+        ('metricId', Exam.metric_id),
+        ('metricName', Metric.name),
+        ('healthStatus', classification.status),
+        ('rangePosition', classification.position),
+        ('deviation', classification.deviation),
+    )
+    joins = {
+        'metricName': Exam.metric,
+        'healthStatus': Exam.metric,
+        'rangePosition': Exam.metric,
+        'deviation': Exam.metric,
+    }
+
+    def dump(self, exam):
+        status, position, deviation = classification.classify(exam.value, exam.metric)
+        return {
+            'id': exam.id,
+            'value': exam.value,
+            'dateCreated': exam.date_created,
+            'dateModified': exam.date_modified,
+            'visitId': exam.visit_id,
+            'metricId': exam.metric_id,
+            'metricName': exam.metric.name,
+            'healthStatus': status,
+            'rangePosition': position,
+            'deviation': deviation
+        }
+
+
+class VisitSchema(Schema):
+    columns = (
+        ('id', Visit.id),
+        ('name', Visit.name),
+        ('dateCreated', Visit.date_created),
+        ('dateModified', Visit.date_modified),
+        ('userUsername', User.username),
+        ('userGender', User.gender),
+        ('healthScore', Visit.health_score),
+    )
+    joins = {
+        'userUsername': Visit.user,
+        'userGender': Visit.user,
+    }
+
+    def dump(self, visit):
+        return {
+            'id': visit.id,
+            'name': visit.name,
+            'dateCreated': visit.date_created,
+            'dateModified': visit.date_modified,
+            'userUsername': visit.user.username,
+            'userGender': visit.user.gender,
+            'healthScore': visit.health_score
+        }
+
+
+class VisitExamsSchema(VisitSchema):
+
+    def nest(self, visits, exams, skip_empty=False):
+        """Visit rows with their exam rows, both in query order.
+
+        The exams are read after the visits, so they are restricted to
+        those visits: a visit created in between would have no entry.
+        """
+        results = self.dump_rows(visits)
+        by_id = {}
+        for result in results:
+            result['exams'] = []
+            by_id[result['id']] = result
+        if not by_id:
+            return results
+        for row in exams.filter(Exam.visit_id.in_(list(by_id))):
+            exam = exam_schema.dump_row(row)
+            by_id[exam['visitId']]['exams'].append(exam)
+        if skip_empty:
+            results = [result for result in results if result['exams']]
+        return results
+
+
+class MetricSchema(Schema):
+    columns = (
+        ('id', Metric.id),
+        ('name', Metric.name),
+        ('weight', Metric.weight),
+        ('unitLabel', Metric.unit_label),
+        ('totalRangeMin', Metric.total_range_min),
+        ('totalRangeMax', Metric.total_range_max),
+        ('healthyRangeMin', Metric.healthy_range_min),
+        ('healthyRangeMax', Metric.healthy_range_max),
+        ('gender', Metric.gender),
+        ('categoryId', Metric.category_id),
+        ('categoryName', Category.name),
+    )
+    joins = {
+        'categoryName': Metric.category,
+    }
+
+    def dump(self, metric):
+        return {
+            'id': metric.id,
+            'name': metric.name,
+            'weight': metric.weight,
+            'unitLabel': metric.unit_label,
+            'totalRangeMin': metric.total_range_min,
+            'totalRangeMax': metric.total_range_max,
+            'healthyRangeMin': metric.healthy_range_min,
+            'healthyRangeMax': metric.healthy_range_max,
+            'gender': metric.gender,
+            'categoryId': metric.category_id,
+            'categoryName': None if metric.category is None else metric.category.name
+        }
+
+
+class MetricDataSchema(Schema):
+    options = (joinedload(Metric.category),)
+
+    def dump(self, metric):
+        return {
+            'name': metric.name,
+            'weight': metric.weight,
+            'unit_label': metric.unit_label,
+            'features': {
+                'totalrange': [
+                    metric.total_range_min,
+                    metric.total_range_max
+                ],
+                'healthyrange': [
+                    metric.healthy_range_min,
+                    metric.healthy_range_max
+                ]
+            }
+        }
+
+
+class CategorySchema(Schema):
+
+    def dump(self, category):
+        return {
+            'id': category.id,
+            'name': category.name
+        }
+
+
+class UserSchema(Schema):
+    columns = (
+        ('id', User.id),
+        ('username', User.username),
+        ('gender', User.gender),
+        ('birthDate', User.birth_date),
+        ('dateCreated', User.date_created),
+    )
+
+    def dump(self, user):
+        return {
+            'id': user.id,
+            'username': user.username,
+            'gender': user.gender,
+            'birthDate': user.birth_date,
+            'dateCreated': user.date_created
+        }
+
+
+class JobSchema(Schema):
+
+    def dump(self, job):
+        return {
+            'id': job.id,
+            'kind': job.kind,
+            'status': job.status,
+            'dateCreated': job.date_created,
+            'dateStarted': job.date_started,
+            'dateFinished': job.date_finished,
+            'error': job.error,
+            'result': None if job.result is None else json.loads(job.result)
+        }
+
+
+class DeletionSchema(Schema):
+
+    def dump(self, deletion):
+        return {
+            'id': deletion.id,
+            'kind': deletion.kind,
+            'targetId': deletion.target_id,
+            'status': deletion.status,
+            'deleted': deletion.deleted,
+            'total': deletion.total,
+            'dateCreated': deletion.date_created,
+            'dateModified': deletion.date_modified
+        }
+
+
+exam_schema = ExamSchema()
+visit_schema = VisitSchema()
+visit_exams_schema = VisitExamsSchema()
+metric_schema = MetricSchema()
+metric_data_schema = MetricDataSchema()
+category_schema = CategorySchema()
+user_schema = UserSchema()
+job_schema = JobSchema()
+deletion_schema = DeletionSchema()
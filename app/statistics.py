@@ -0,0 +1,112 @@
+import datetime
+import math
+
+from sqlalchemy import and_, or_, cast
+from sqlalchemy.sql import func
+
+from app import db
+from app.distributions import describe_cohort
+from app.models import Exam, Visit, User, Metric, MetricAggregate
+
+DAYS_PER_YEAR = 365.2425
+
+
+def parse_range(value):
+    try:
+        bounds = value.split(',')
+        return int(bounds[0]), int(bounds[1])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def birth_date_bounds(age_min, age_max, now=None):
+    # age is (now - birth_date).days // DAYS_PER_YEAR, so the age window
+    # maps to a half-open birth date window: (oldest, youngest]
+    now = now or datetime.datetime.now()
+    youngest = now - datetime.timedelta(days=math.ceil(age_min * DAYS_PER_YEAR))
+    oldest = now - datetime.timedelta(days=math.ceil((age_max + 1) * DAYS_PER_YEAR))
+    return oldest, youngest
+
+
+def cohort_visit_ids(gender, age, ranges):
+    oldest, youngest = birth_date_bounds(*age)
+    visits = Visit.query.join(Visit.user).filter(
+        User.gender == gender,
+        User.birth_date > oldest,
+        User.birth_date <= youngest
+    )
+
+    out_of_range = [
+        and_(Metric.name == name, or_(Exam.value < low, Exam.value > high))
+        for name, (low, high) in ranges.items()
+    ]
+    if out_of_range:
+        bad_exams = db.session.query(Exam.id).join(Exam.metric).filter(
+            Exam.visit_id == Visit.id,
+            or_(*out_of_range)
+        )
+        visits = visits.filter(~bad_exams.exists())
+
+    return visits.with_entities(Visit.id)
+
+
+def aggregate_averages(gender, age):
+    oldest, youngest = birth_date_bounds(*age)
+    value_count = func.sum(MetricAggregate.value_count)
+    return MetricAggregate.query.join(Metric).with_entities(
+        Metric.name, (cast(func.sum(MetricAggregate.value_sum), db.Numeric) / value_count).label('avg')
+    ).filter(
+        MetricAggregate.gender == gender,
+        MetricAggregate.birth_date > oldest,
+        MetricAggregate.birth_date <= youngest
+    ).group_by(MetricAggregate.metric_id, Metric.name).having(value_count > 0).all()
+
+
+def cohort_metric_averages(gender, age, ranges):
+    # metric ranges filter single visits, which the aggregates can't see
+    if ranges:
+        return metric_averages(cohort_visit_ids(gender, age, ranges))
+    return aggregate_averages(gender, age)
+
+
+def metric_averages(visit_ids):
+    return Exam.query.join(Exam.metric).with_entities(
+        Metric.name, func.avg(Exam.value).label('avg')
+    ).filter(Exam.visit_id.in_(visit_ids)).group_by(Exam.metric_id, Metric.name).all()
+
+
+def exam_statistics(params):
+    """Result of /exams/statistics for the parameters the view parsed.
+
+    `params` is plain JSON (see app.jobs): visits, a gender/age/ranges
+    cohort or the userId whose visits are described, plus details,
+    percentiles and bins.
+    """
+    visit_id = None
+    averages = None
+    if 'visits' in params:
+        visit_id = params['visits']
+    elif 'gender' in params:
+        age = tuple(params['age'])
+        ranges = {name: tuple(bounds) for name, bounds in params['ranges'].items()}
+        if params['details']:
+            visit_id = cohort_visit_ids(params['gender'], age, ranges)
+        else:
+            averages = cohort_metric_averages(params['gender'], age, ranges)
+    else:
+        visit_id = Visit.query.filter_by(user_id=params['userId']).with_entities(Visit.id)
+
+    if params['details']:
+        return describe_cohort(visit_id, params['percentiles'], params['bins'])
+
+    if averages is None:
+        averages = metric_averages(visit_id)
+
+    results = []
+    for avg in averages:
+        obj = {
+            'metricName': avg[0],
+            'value': int(avg[1])
+        }
+        results.append(obj)
+    return results
@@ -0,0 +1,121 @@
+import datetime
+import random
+
+from app import db, aggregates, scores
+from app.models import Exam, Visit, User, Metric, Category
+from app.passwords import password_hasher
+
+CHUNK_SIZE = 10000
+GENDERS = ('male', 'female')
+PASSWORD = 'password'
+
+# name, unit, total range, healthy range
+METRICS = (
+    ('glucose', 'mg/dL', (40, 300), (70, 100)),
+    ('cholesterol', 'mg/dL', (100, 350), (125, 200)),
+    ('hdl', 'mg/dL', (10, 120), (40, 60)),
+    ('ldl', 'mg/dL', (30, 250), (50, 130)),
+    ('triglycerides', 'mg/dL', (30, 600), (50, 150)),
+    ('systolic', 'mmHg', (70, 220), (90, 120)),
+    ('diastolic', 'mmHg', (40, 140), (60, 80)),
+    ('heart_rate', 'bpm', (30, 200), (60, 100)),
+    ('hemoglobin', 'g/dL', (5, 22), (12, 17)),
+    ('creatinine', 'mg/dL', (0, 10), (0, 1)),
+    ('weight', 'kg', (30, 200), (55, 85)),
+    ('bmi', 'kg/m2', (12, 60), (18, 25)),
+)
+CATEGORIES = {
+    'blood': ('glucose', 'cholesterol', 'hdl', 'ldl', 'triglycerides', 'hemoglobin', 'creatinine'),
+    'cardio': ('systolic', 'diastolic', 'heart_rate'),
+}
+
+
+def insert_chunks(table, rows):
+    for start in range(0, len(rows), CHUNK_SIZE):
+        db.session.execute(table.insert().values(rows[start:start + CHUNK_SIZE]))
+
+
+def generate(exams=10000, exams_per_visit=12, visits_per_user=5, seed=1):
+    """Fills the database with users, visits, metrics, categories and exams.
+
+    Every visit measures `exams_per_visit` metrics of the user's gender,
+    with values spread around the healthy range. Rows are written with
+    multi-row INSERTs of CHUNK_SIZE rows, so ten million exams are fine.
+    """
+    rng = random.Random(seed)
+    now = datetime.datetime.now()
+
+    categories = {}
+    for name in CATEGORIES:
+        categories[name] = db.session.execute(
+            Category.__table__.insert().values(name=name).returning(Category.__table__.c.id)
+        ).scalar()
+    category_of = {metric: categories[name] for name, metrics in CATEGORIES.items() for metric in metrics}
+
+    metrics = {gender: [] for gender in GENDERS}
+    for gender in GENDERS:
+        for name, unit, total, healthy in METRICS:
+            metric_id = db.session.execute(Metric.__table__.insert().values(
+                name=name, weight=rng.randint(1, 5), unit_label=unit,
+                total_range_min=total[0], total_range_max=total[1],
+                healthy_range_min=healthy[0], healthy_range_max=healthy[1],
+                gender=gender, category_id=category_of.get(name)
+            ).returning(Metric.__table__.c.id)).scalar()
+            metrics[gender].append((metric_id, total, healthy))
+
+    exams_per_visit = min(exams_per_visit, len(METRICS))
+    n_visits = max(1, exams // exams_per_visit)
+    n_users = max(1, n_visits // visits_per_user)
+
+    password_hash = password_hasher.hash(PASSWORD)
+    prefix = 'synth{}_'.format(seed)
+    users = [{
+        'username': '{}{}'.format(prefix, i),
+        'email': '{}{}@example.com'.format(prefix, i),
+        'password_hash': password_hash,
+        'gender': rng.choice(GENDERS),
+        'birth_date': now - datetime.timedelta(days=rng.randint(18 * 365, 90 * 365)),
+        'admin': i == 0,
+        'date_created': now,
+        'date_modified': now
+    } for i in range(n_users)]
+    insert_chunks(User.__table__, users)
+    user_rows = db.session.query(User.id, User.gender).filter(
+        User.username.startswith(prefix, autoescape=True)
+    ).all()
+
+    visits = []
+    for i in range(n_visits):
+        user_id, gender = user_rows[i % len(user_rows)]
+        date = now - datetime.timedelta(days=rng.randint(0, 5 * 365))
+        visits.append({
+            'name': 'visit {}'.format(i), 'user_id': user_id, 'date_created': date, 'date_modified': date
+        })
+    insert_chunks(Visit.__table__, visits)
+    visit_rows = db.session.query(Visit.id, User.gender, Visit.date_created).join(Visit.user).filter(
+        User.username.startswith(prefix, autoescape=True)
+    ).all()
+
+    rows = []
+    for visit_id, gender, date in visit_rows:
+        for metric_id, total, healthy in rng.sample(metrics[gender], exams_per_visit):
+            center = (healthy[0] + healthy[1]) / 2.0
+            spread = max(1.0, (healthy[1] - healthy[0]) / 1.5)
+            value = int(min(total[1], max(total[0], rng.gauss(center, spread))))
+            rows.append({
+                'value': value, 'visit_id': visit_id, 'metric_id': metric_id,
+                'date_created': date, 'date_modified': date
+            })
+        if len(rows) >= CHUNK_SIZE:
+            insert_chunks(Exam.__table__, rows)
+            rows = []
+    insert_chunks(Exam.__table__, rows)
+    db.session.commit()
+
+    # the exams went in without the ORM events
+    aggregates.rebuild()
+    scores.rebuild()
+    return {
+        'users': n_users, 'visits': n_visits, 'exams': n_visits * exams_per_visit,
+        'admin': prefix + '0', 'password': PASSWORD
+    }
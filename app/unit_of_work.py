@@ -0,0 +1,55 @@
+from app import db
+
+
+class UnitOfWork(object):
+    """Collects the writes of a request and commits them once.
+
+    Models enlist themselves through save()/delete(); the transaction is
+    committed after the handler returned a successful response and rolled
+    back otherwise. Code running outside a request (manage.py commands)
+    has to call commit() itself.
+    """
+
+    def init_app(self, app):
+        app.after_request(self.finish)
+
+    def add(self, obj):
+        db.session.add(obj)
+        # ids and defaults are needed to build the response
+        db.session.flush()
+        self.mark()
+
+    def delete(self, obj):
+        db.session.delete(obj)
+        self.mark()
+
+    def mark(self):
+        db.session.info['unit_of_work_pending'] = True
+
+    def after_commit(self, callback):
+        db.session.info.setdefault('unit_of_work_callbacks', []).append(callback)
+        self.mark()
+
+    def commit(self):
+        info = db.session.info
+        if not info.pop('unit_of_work_pending', False):
+            return
+        callbacks = info.pop('unit_of_work_callbacks', [])
+        db.session.commit()
+        for callback in callbacks:
+            callback()
+
+    def rollback(self):
+        db.session.info.pop('unit_of_work_pending', None)
+        db.session.info.pop('unit_of_work_callbacks', None)
+        db.session.rollback()
+
+    def finish(self, response):
+        if response.status_code < 400:
+            self.commit()
+        else:
+            self.rollback()
+        return response
+
+
+unit_of_work = UnitOfWork()
@@ -0,0 +1,55 @@
+from flask import Blueprint, request
+
+from app.auth import token_required
+from app.encoding import jsonify
+from app.models import Category
+from app.serializers import category_schema
+
+blueprint = Blueprint('categories', __name__)
+
+
+@blueprint.route('/categories', methods=['POST', 'GET'])
+@token_required
+def category(user):
+    if not user.admin:
+        return {}, 403
+    if request.method == 'POST':
+        try:
+            name = str(request.data['name'])
+        except KeyError:
+            return {}, 400
+
+        category = Category(name=name)
+        category.save()
+        response = jsonify(category_schema.dump(category))
+        response.status_code = 201
+        return response
+    else:
+        response = jsonify(category_schema.dump_many(Category.get_all()))
+        response.status_code = 200
+        return response
+
+
+@blueprint.route('/categories/<int:id>', methods=['GET', 'PUT', 'DELETE'])
+@token_required
+def category_details(user, id, **kwargs):
+    if not user.admin:
+        return {}, 403
+    category = Category.query.get_or_404(id)
+
+    if request.method == 'DELETE':
+        category.delete()
+        return {
+                   "message": "category {} deleted successfully".format(category.id)
+               }, 200
+
+    elif request.method == 'PUT':
+        category.name = str(request.data.get('name', category.name))
+        category.save()
+        response = jsonify(category_schema.dump(category))
+        response.status_code = 200
+        return response
+    else:
+        response = jsonify(category_schema.dump(category))
+        response.status_code = 200
+        return response
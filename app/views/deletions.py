@@ -0,0 +1,32 @@
+from flask import Blueprint, current_app, url_for
+
+from app.auth import token_required
+from app.deletion import deleter
+from app.encoding import jsonify
+from app.models import Deletion
+from app.replicas import replica_router
+from app.serializers import deletion_schema
+
+blueprint = Blueprint('deletions', __name__)
+
+
+def start_deletion(kind, id, user):
+    """Starts a chunked deletion, the response points to its progress."""
+    deletion = deleter.start(current_app._get_current_object(), kind, id, user.id)
+    response = jsonify(deletion_schema.dump(deletion))
+    response.status_code = 202
+    response.headers['Location'] = url_for('deletions.deletion', id=deletion.id)
+    return response
+
+
+@blueprint.route('/deletions/<int:id>', methods=['GET'])
+@token_required
+def deletion(user, id):
+    # polled while the chunks commit, a replica lags behind them
+    replica_router.use_primary()
+    deletion = Deletion.query.get(id)
+    if deletion is None or not (user.admin or deletion.user_id == user.id):
+        return {}, 404
+    response = jsonify(deletion_schema.dump(deletion))
+    response.status_code = 200
+    return response
@@ -0,0 +1,167 @@
+from flask import Blueprint, request, abort, Response, stream_with_context
+
+from app import classification, statistics
+from app.auth import token_required
+from app.classification import parse_status, SORTS
+from app.distributions import parse_percentiles, DEFAULT_BINS
+from app.encoding import jsonify
+from app.export import csv_chunks
+from app.models import Exam, Visit, Metric
+from app.pagination import list_response, detail_response
+from app.serializers import exam_schema
+from app.statistics import parse_range
+from app.views.jobs import start_job
+
+blueprint = Blueprint('exams', __name__)
+
+
+@blueprint.route('/exams', methods=['POST', 'GET'])
+@token_required
+def exam(user):
+    if request.method == 'POST':
+        try:
+            metric_id = request.data['metricId']
+            visit_id = request.data['visitId']
+            value = Exam.parse_value(request.data['value'])
+        except (KeyError, ValueError):
+            return {}, 400
+
+        metric = Metric.query.filter_by(id=metric_id)
+        visit = Visit.query.filter_by(id=visit_id)
+
+        if not user.admin:
+            metric = metric.filter_by(gender=user.gender)
+            visit = visit.filter_by(user_id=user.id)
+
+        metric = metric.first()
+        visit = visit.first()
+        if visit is None or metric is None:
+            return {}, 400
+
+        exam = Exam(value=value, metric=metric, visit=visit)
+        exam.save()
+        Visit.touch(visit.id)
+        response = jsonify(exam_schema.dump(exam))
+        response.status_code = 201
+        return response
+    else:
+        statuses = parse_status(request.values.get('status'))
+        sort = request.values.get('sort')
+        if statuses is None or sort not in SORTS:
+            return {}, 400
+        filters = (classification.status.in_(statuses),) if statuses else ()
+
+        try:
+            visit_id = request.values['visitId']
+        except KeyError:
+            keyset = (Exam.id,)
+            if user.admin:
+                exams = Exam.query
+            else:
+                visit_ids = Visit.query.filter_by(user_id=user.id).with_entities(Visit.id)
+                exams = Exam.query.filter(Exam.visit_id.in_(visit_ids))
+        else:
+            visit = Visit.query.filter_by(id=visit_id)
+            if not user.admin:
+                visit = visit.filter_by(user_id=user.id)
+            visit = visit.first()
+            exams = Exam.query.filter_by(visit=visit)
+            keyset = (Exam.metric_id, Exam.id)
+        if sort == 'deviation':
+            # most abnormal first
+            keyset = (-classification.deviation, Exam.id)
+        # the classification columns need the metric whatever the fields
+        joins = (Exam.metric,) if statuses or sort == 'deviation' else ()
+        return list_response(exams, keyset, exam_schema, filters, joins)
+
+
+@blueprint.route('/exams/<int:id>', methods=['GET', 'PUT', 'DELETE'])
+@token_required
+def exam_details(user, id, **kwargs):
+    if request.method == 'GET':
+        exams = Exam.query.filter_by(id=id)
+        if not user.admin:
+            visit_ids = Visit.query.filter_by(user_id=user.id).with_entities(Visit.id)
+            exams = exams.filter(Exam.visit_id.in_(visit_ids))
+        return detail_response(exams, exam_schema)
+
+    if user.admin:
+        exam = Exam.query.get_or_404(id)
+    else:
+        visit_ids = Visit.query.filter_by(user_id=user.id).with_entities(Visit.id)
+        exam = Exam.query.filter(Exam.visit_id.in_(visit_ids)).filter_by(id=id,).first()
+        if not exam:
+            abort(404)
+
+    if request.method == 'DELETE':
+        Visit.touch(exam.visit_id)
+        exam.delete()
+        return {
+                   "message": "exam {} deleted successfully".format(exam.id)
+               }, 200
+
+    elif request.method == 'PUT':
+        try:
+            exam.value = Exam.parse_value(request.data.get('value', exam.value))
+        except ValueError:
+            return {}, 400
+        # No control for authorization
+        # metric_id = request.data.get('metricId', exam.metric.id)
+        # visit_id = request.data.get('visitId', exam.visit.id)
+        # exam.metric = Metric.query.get(metric_id)
+        # exam.visit = Visit.query.get(visit_id)
+        exam.save()
+        Visit.touch(exam.visit_id)
+        response = jsonify(exam_schema.dump(exam))
+        response.status_code = 200
+        return response
+
+
+@blueprint.route('/exams/export', methods=['GET'])
+@token_required
+def exam_export(user):
+    if not user.admin:
+        return {}, 403
+    response = Response(stream_with_context(csv_chunks()), mimetype='text/csv')
+    response.headers['Content-Disposition'] = 'attachment; filename=exams.csv'
+    return response
+
+
+@blueprint.route('/exams/statistics', methods=['GET'])
+@token_required
+def exam_statistics(user):
+    details = request.values.get('details') == '1'
+    percentiles = parse_percentiles(request.values.get('percentiles'))
+    bins = request.values.get('bins', DEFAULT_BINS, type=int)
+    if percentiles is None or not 0 < bins <= 1000:
+        return {}, 400
+
+    query = {'details': details, 'percentiles': list(percentiles), 'bins': bins}
+    if user.admin:
+        visit_id = request.args.getlist('visits[]', type=int)
+        if not len(visit_id):
+            params = request.values.to_dict()
+            for key in ('details', 'percentiles', 'bins', 'async'):
+                params.pop(key, None)
+            gender = params.pop('gender')
+            filter_age = parse_range(params.pop('age'))
+            if filter_age is None:
+                return {}, 400
+
+            ranges = {}
+            for key, value in params.items():
+                values = parse_range(value)
+                if values is not None:
+                    ranges[key] = values
+            query.update(gender=gender, age=filter_age, ranges=ranges)
+        else:
+            query['visits'] = visit_id
+    else:
+        query['userId'] = user.id
+
+    if request.values.get('async') == '1':
+        return start_job('statistics', query, user)
+
+    response = jsonify(statistics.exam_statistics(query))
+    response.status_code = 200
+    return response
@@ -0,0 +1,35 @@
+from flask import Blueprint, url_for
+
+from app.auth import token_required
+from app.encoding import jsonify
+from app.jobs import job_queue
+from app.models import Job
+from app.replicas import replica_router
+from app.serializers import job_schema
+
+blueprint = Blueprint('jobs', __name__)
+
+
+def start_job(kind, params, user):
+    """Queues (or reuses) a job, the response points to its status."""
+    # a replica may miss a job queued moments ago and can't see the new
+    # row, whose defaults are loaded again after the flush
+    replica_router.use_primary()
+    job = job_queue.enqueue(kind, params, user.id)
+    response = jsonify(job_schema.dump(job))
+    response.status_code = 202
+    response.headers['Location'] = url_for('jobs.job', id=job.id)
+    return response
+
+
+@blueprint.route('/jobs/<int:id>', methods=['GET'])
+@token_required
+def job(user, id):
+    # polled right after the job was queued, a replica may not have it yet
+    replica_router.use_primary()
+    job = Job.query.get(id)
+    if job is None or not (user.admin or job.user_id == user.id):
+        return {}, 404
+    response = jsonify(job_schema.dump(job))
+    response.status_code = 200
+    return response
@@ -0,0 +1,118 @@
+from flask import Blueprint, request
+
+from app import db
+from app.auth import token_required
+from app.cache import catalog_cache
+from app.encoding import jsonify
+from app.models import Metric, Category
+from app.pagination import detail_response
+from app.replicas import replica_router
+from app.serializers import metric_schema, metric_data_schema
+from app.views.deletions import start_deletion
+
+blueprint = Blueprint('metrics', __name__)
+
+
+@blueprint.route('/metrics', methods=['POST', 'GET'])
+@token_required
+def metric(user):
+    if request.method == 'POST':
+        if not user.admin:
+            return {}, 403
+        category_id = request.data.get('categoryId', None)
+
+        metric = Metric(
+            name=str(request.data['name']),
+            weight=request.data['weight'],
+            unit_label=str(request.data['unitLabel']),
+            total_range_min=request.data['totalRangeMin'],
+            total_range_max=request.data['totalRangeMax'],
+            healthy_range_min=request.data['healthyRangeMin'],
+            healthy_range_max=request.data['healthyRangeMax'],
+            gender=str(request.data['gender']),
+        )
+        try:
+            category = Category.query.get(category_id)
+            metric.category = category
+        except:
+            db.session.rollback()
+        metric.save()
+        response = jsonify(metric_schema.dump(metric))
+        response.status_code = 201
+        return response
+    else:
+        gender = request.values.get('gender', None)
+        columns = metric_schema.parse_fields(request.values.get('fields'))
+        if columns is None:
+            return {}, 400
+        if gender is None:
+            metrics = Metric.query
+        else:
+            metrics = Metric.query.filter_by(gender=gender)
+        fields = ','.join(key for key, _ in columns)
+
+        def catalog():
+            # cached until the next change, a lagging replica would keep
+            # serving the data from before it
+            replica_router.use_primary()
+            return metric_schema.dump_rows(metric_schema.rows(metrics, columns=columns), columns)
+
+        return catalog_cache.response('metrics:{}:{}'.format(gender, fields), catalog)
+
+
+@blueprint.route('/metrics/<int:id>', methods=['GET', 'PUT', 'DELETE'])
+@token_required
+def metric_details(user, id, **kwargs):
+    if not user.admin:
+        return {}, 403
+    if request.method == 'GET':
+        return detail_response(Metric.query.filter_by(id=id), metric_schema)
+    metric = Metric.query.get_or_404(id)
+
+    if request.method == 'DELETE':
+        if request.values.get('async') == '1':
+            return start_deletion('metric', metric.id, user)
+        metric.delete()
+        return {
+                   "message": "metric {} deleted successfully".format(metric.id)
+               }, 200
+
+    elif request.method == 'PUT':
+        metric.name = str(request.data.get('name', metric.name))
+        metric.weight = request.data.get('weight', metric.weight)
+        metric.unit_label = str(request.data.get('unitLabel', metric.unit_label))
+        metric.total_range_min = request.data.get('totalRangeMin', metric.total_range_min)
+        metric.total_range_max = request.data.get('totalRangeMax', metric.total_range_max)
+        metric.healthy_range_min = request.data.get('healthyRangeMin', metric.healthy_range_min)
+        metric.healthy_range_max = request.data.get('healthyRangeMax', metric.healthy_range_max)
+        metric.gender = request.data.get('gender', metric.gender)
+        metric.save()
+        response = jsonify(metric_schema.dump(metric))
+        response.status_code = 200
+        return response
+
+
+@blueprint.route('/metrics/data', methods=['GET'])
+@token_required
+def metric_data(user):
+    gender = request.values.get('gender', user.gender)
+
+    def catalog():
+        replica_router.use_primary()
+        results = []
+        categories = {}
+        metrics = metric_data_schema.query(Metric.query.filter_by(gender=gender))
+        for metric in metrics.order_by(Metric.category_id, Metric.id):
+            if metric.category is None:
+                results.append(metric_data_schema.dump(metric))
+                continue
+            if metric.category_id not in categories:
+                categories[metric.category_id] = {
+                    'name': metric.category.name,
+                    'details': []
+                }
+                results.insert(len(categories) - 1, categories[metric.category_id])
+            categories[metric.category_id]['details'].append(metric_data_schema.dump(metric))
+        return results
+
+    return catalog_cache.response('data:{}'.format(gender), catalog)
@@ -0,0 +1,119 @@
+import datetime
+
+import jwt
+from flask import Blueprint, request, current_app
+from sqlalchemy import or_
+from werkzeug.exceptions import BadRequest
+
+from app import db
+from app.auth import token_required
+from app.database import pool_status
+from app.encoding import jsonify
+from app.models import User
+from app.pagination import detail_response
+from app.replicas import replica_router
+from app.serializers import user_schema
+from app.views.deletions import start_deletion
+
+blueprint = Blueprint('users', __name__)
+
+
+@blueprint.route('/users', methods=['POST', 'GET'])
+def user():
+    if request.method == 'POST':
+        try:
+            username = request.json['username']
+            email = request.json['email']
+            password = request.json['password']
+            gender = request.json['gender']
+            birth_date = request.json['birthDate']
+        except BadRequest:
+            return {}, 400
+
+        username = username.lower()
+        email = email.lower()
+
+        taken = User.query.filter(or_(User.username == username, User.email == email))
+        if db.session.query(taken.exists()).scalar():
+            return {}, 400
+        user = User(username=username, gender=gender, birth_date=birth_date, email=email)
+        user.hash_password(password)
+        user.save()
+        return jsonify({
+            'username': user.username,
+            'email': user.email,
+            'gender': user.gender,
+            'birthDate': user.birth_date,
+            'dateCreated': user.date_created,
+            'dateModified': user.date_modified
+        }), 201
+    else:
+        columns = user_schema.parse_fields(request.values.get('fields'))
+        if columns is None:
+            return {}, 400
+        response = jsonify(user_schema.dump_rows(user_schema.rows(User.query, columns=columns).order_by(User.username), columns))
+        response.status_code = 200
+        return response
+
+
+@blueprint.route('/users/<int:id>', methods=['GET', 'DELETE'])
+@token_required
+def user_details(user, id, **kwargs):
+    if request.method == 'GET':
+        if not user.admin and user.id != id:
+            return {}, 404
+        return detail_response(User.query.filter_by(id=id), user_schema)
+    if not user.admin:
+        return {}, 403
+    target = User.query.get_or_404(id)
+    if request.values.get('async') == '1':
+        return start_deletion('user', target.id, user)
+    target.delete()
+    return {
+               "message": "user {} deleted successfully".format(target.id)
+           }, 200
+
+
+@blueprint.route('/status/pool', methods=['GET'])
+@token_required
+def pool(user):
+    if not user.admin:
+        return {}, 403
+    status = pool_status(db.engine)
+    status['replicas'] = {key: pool_status(engine) for key, engine in replica_router.engines().items()}
+    response = jsonify(status)
+    response.status_code = 200
+    return response
+
+
+@blueprint.route('/login', methods=['POST'])
+def login():
+    try:
+        username = request.json['username']
+        password = request.json['password']
+    except BadRequest:
+        return {}, 400
+
+    user = User.query.filter_by(username=username.lower()).first()
+
+    if not user:
+        return {}, 400
+
+    if user.check_password(password):
+        if user.password_needs_rehash():
+            user.hash_password(password)
+            user.save()
+
+        token = jwt.encode(
+            payload={
+                'id': user.id,
+                'exp': datetime.datetime.utcnow() + datetime.timedelta(minutes=60),
+                'admin': user.admin,
+                'gender': user.gender
+            },
+            key=current_app.config['SECRET']
+        )
+
+        return jsonify({'access_token': token.decode('UTF-8')})
+
+    return {}, 403
@@ -0,0 +1,199 @@
+from flask import Blueprint, request, Response
+
+from app import db, aggregates, classification, scores
+from app.auth import token_required
+from app.classification import parse_status, SORTS
+from app.encoding import jsonify
+from app.history import history_etag, metric_history
+from app.models import Exam, Visit, User, Metric
+from app.pagination import list_response, detail_response
+from app.serializers import exam_schema, visit_schema, visit_exams_schema
+from app.views.deletions import start_deletion
+
+blueprint = Blueprint('visits', __name__)
+
+
+@blueprint.route('/visits', methods=['POST', 'GET'])
+@token_required
+def visit(user):
+    if request.method == 'POST':
+        try:
+            name = str(request.data['name'])
+        except KeyError:
+            return {}, 400
+
+        visit = Visit(
+            name=name,
+            user=User.query.get(user.id)
+        )
+        visit.save()
+        response = jsonify(visit_schema.dump(visit))
+        response.status_code = 201
+        return response
+    else:
+        min_score = request.values.get('minScore', type=float)
+        max_score = request.values.get('maxScore', type=float)
+        sort = request.values.get('sort')
+        if sort not in (None, 'score'):
+            return {}, 400
+
+        if user.admin:
+            filter_user = request.values.get('user')
+            if filter_user is None:
+                visits = Visit.query.filter_by()
+            else:
+                visits = Visit.query.filter_by(user_id=filter_user)
+        else:
+            visits = Visit.query.filter_by(user_id=user.id)
+
+        if min_score is not None:
+            visits = visits.filter(Visit.health_score >= min_score)
+        if max_score is not None:
+            visits = visits.filter(Visit.health_score <= max_score)
+
+        keyset = (Visit.date_created, Visit.id)
+        if sort == 'score':
+            # worst first, visits without scored exams are left out
+            visits = visits.filter(Visit.health_score.isnot(None))
+            keyset = (Visit.health_score, Visit.id)
+        return list_response(visits, keyset, visit_schema)
+
+
+@blueprint.route('/visits/<int:id>', methods=['GET', 'PUT', 'DELETE'])
+@token_required
+def visit_details(user, id, **kwargs):
+    visit = Visit.query.filter_by(id=id)
+    if not user.admin:
+        visit = visit.filter_by(user_id=user.id)
+    if request.method == 'GET':
+        return detail_response(visit, visit_schema)
+    visit = visit.first()
+    if not visit:
+        return {}, 404
+
+    if request.method == 'DELETE':
+        if request.values.get('async') == '1':
+            return start_deletion('visit', visit.id, user)
+        visit.delete()
+        return {
+                   "message": "visit {} deleted successfully".format(visit.id)
+               }, 200
+
+    elif request.method == 'PUT':
+        visit.name = str(request.data.get('name', visit.name))
+        visit.save()
+        response = jsonify(visit_schema.dump(visit))
+        response.status_code = 200
+        return response
+
+
+@blueprint.route('/visits/<int:id>/exams', methods=['POST'])
+@token_required
+def visit_exams(user, id, **kwargs):
+    visit = Visit.query.filter_by(id=id)
+    if not user.admin:
+        visit = visit.filter_by(user_id=user.id)
+    visit = visit.first()
+    if not visit:
+        return {}, 404
+
+    items = request.data
+    if not isinstance(items, list) or not items:
+        return {}, 400
+
+    metric_ids = set()
+    for item in items:
+        try:
+            metric_ids.add(int(item['metricId']))
+        except (KeyError, TypeError, ValueError):
+            pass
+    metrics = Metric.query.filter(Metric.id.in_(metric_ids))
+    if not user.admin:
+        metrics = metrics.filter_by(gender=user.gender)
+    metric_names = dict(metrics.with_entities(Metric.id, Metric.name))
+
+    results = []
+    rows = []
+    for item in items:
+        try:
+            metric_id = int(item['metricId'])
+            value = item['value']
+        except (KeyError, TypeError, ValueError):
+            results.append({'status': 400, 'message': 'metricId and value are required'})
+            continue
+        try:
+            value = Exam.parse_value(value)
+        except ValueError:
+            results.append({'status': 400, 'message': 'value must be an integer'})
+            continue
+        if metric_id not in metric_names:
+            results.append({'status': 400, 'message': 'metric {} not found'.format(metric_id)})
+            continue
+        results.append({'status': 201})
+        rows.append({'visit_id': visit.id, 'metric_id': metric_id, 'value': value})
+
+    if rows:
+        created = iter(zip(rows, Exam.insert_many(rows)))
+        aggregates.add_many(db.session.connection(), rows)
+        scores.add_many(db.session.connection(), rows)
+        for result in results:
+            if result['status'] != 201:
+                continue
+            row, inserted = next(created)
+            result.update({
+                'id': inserted.id,
+                'value': row['value'],
+                'dateCreated': inserted.date_created,
+                'dateModified': inserted.date_modified,
+                'visitId': visit.id,
+                'metricId': row['metric_id'],
+                'metricName': metric_names[row['metric_id']]
+            })
+            visit.date_modified = inserted.date_modified
+        visit.save()
+
+    response = jsonify(results)
+    response.status_code = 201 if rows else 400
+    return response
+
+
+@blueprint.route('/visits/exams', methods=['POST', 'GET'])
+@token_required
+def exam_group(user):
+    if not user.admin:
+        return {}, 403
+    user_id = request.values.get('userId', user.id)
+    statuses = parse_status(request.values.get('status'))
+    sort = request.values.get('sort')
+    if statuses is None or sort not in SORTS:
+        return {}, 400
+
+    visits = visit_exams_schema.rows(Visit.query.filter_by(user_id=user_id)).order_by(Visit.date_modified)
+    exams = exam_schema.rows(Exam.query.join(Exam.visit).filter(Visit.user_id == user_id))
+    if statuses:
+        exams = exams.filter(classification.status.in_(statuses))
+    if sort == 'deviation':
+        exams = exams.order_by(classification.deviation.desc(), Exam.id)
+    else:
+        exams = exams.order_by(Exam.id)
+    response = jsonify(visit_exams_schema.nest(visits, exams, skip_empty=bool(statuses)))
+    response.status_code = 200
+    return response
+
+
+@blueprint.route('/visits/history', methods=['GET'])
+@token_required
+def visit_history(user):
+    user_id = user.id
+    if user.admin:
+        user_id = request.values.get('userId', user.id, type=int)
+
+    etag = history_etag(user_id)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(metric_history(user_id))
+        response.status_code = 200
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
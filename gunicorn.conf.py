@@ -0,0 +1,34 @@
+import gc
+import os
+
+from instance.config import app_config
+
+config = app_config[os.getenv('APP_SETTINGS', 'production')]
+
+bind = '0.0.0.0:{}'.format(os.getenv('PORT', '8000'))
+worker_class = config.GUNICORN_WORKER_CLASS
+workers = config.GUNICORN_WORKERS
+worker_connections = config.GUNICORN_WORKER_CONNECTIONS
+timeout = config.GUNICORN_TIMEOUT
+# load the app once in the master and share it with the workers copy-on-write;
+# gevent workers patch the stdlib after the fork, so they load it themselves
+preload_app = config.GUNICORN_PRELOAD and worker_class != 'gevent'
+
+
+def when_ready(server):
+    # the collector would otherwise write to every preloaded object and
+    # unshare the pages (Python 3.7+)
+    if preload_app and hasattr(gc, 'freeze'):
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    if worker_class == 'gevent':
+        from app.green import patch_psycopg
+
+        patch_psycopg()
+    if preload_app:
+        from app import db
+        from run import app
+
+        db.reset_engines(app)
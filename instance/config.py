@@ -7,19 +7,89 @@ class Config(object):
     CSRF_ENABLED = True
     SECRET = os.getenv('SECRET')
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL')
+    SQLALCHEMY_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+    SQLALCHEMY_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 5))
+    SQLALCHEMY_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', 10))
+    SQLALCHEMY_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+    SQLALCHEMY_POOL_PRE_PING = True
+    # milliseconds, 0 disables it
+    SQLALCHEMY_STATEMENT_TIMEOUT = int(os.getenv('DB_STATEMENT_TIMEOUT', 30000))
+    # pgbouncer in transaction pooling mode: no client side pool
+    SQLALCHEMY_PGBOUNCER = os.getenv('DB_PGBOUNCER') == '1'
+    # comma separated read replicas, GET requests read from them
+    SQLALCHEMY_REPLICA_URIS = [uri for uri in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if uri]
+    # seconds a user reads from the primary after a write
+    SQLALCHEMY_REPLICA_STICKY = int(os.getenv('DB_REPLICA_STICKY', 5))
+    # replicas further behind are skipped
+    SQLALCHEMY_REPLICA_MAX_LAG = float(os.getenv('DB_REPLICA_MAX_LAG', 10))
     SENTRY_URL = os.getenv('SENTRY_URL')
+    USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 1024))
+    USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', 60))
+    # take admin/gender from the token instead of the users table,
+    # a changed user is then only seen after the token expires
+    AUTH_TRUST_TOKEN_CLAIMS = os.getenv('AUTH_TRUST_TOKEN_CLAIMS') == '1'
+    # 'local' keeps a cache per worker, 'redis' shares it through CACHE_REDIS_URL
+    CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'local')
+    CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL')
+    CACHE_TTL = int(os.getenv('CACHE_TTL', 300))
+    # entries of the local backend per worker
+    CACHE_SIZE = int(os.getenv('CACHE_SIZE', 1024))
+    # statements slower than this are logged with their route, 0 disables it
+    SLOW_QUERY_MS = int(os.getenv('SLOW_QUERY_MS', 500))
+    # bearer token of /metrics-internal, which is off without one
+    METRICS_INTERNAL_TOKEN = os.getenv('METRICS_INTERNAL_TOKEN')
+    # werkzeug method string, stored hashes with another method are
+    # replaced on the next successful login
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:150000')
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_QUEUE = int(os.getenv('PASSWORD_HASH_QUEUE', 16))
+    PASSWORD_HASH_TIMEOUT = int(os.getenv('PASSWORD_HASH_TIMEOUT', 5))
+    # 'auto' hashes in a gevent thread pool under gevent and in processes
+    # otherwise, 'process' or 'thread' force one
+    PASSWORD_HASH_EXECUTOR = os.getenv('PASSWORD_HASH_EXECUTOR', 'auto')
+    # DELETE ...?async=1 removes the exams this many at a time, in the background
+    DELETE_WORKERS = int(os.getenv('DELETE_WORKERS', 1))
+    DELETE_CHUNK_SIZE = int(os.getenv('DELETE_CHUNK_SIZE', 10000))
+    # background job threads in every web worker, by default the jobs are
+    # left to `manage.py run_jobs` so they don't compete with requests
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', 0))
+    # milliseconds, replaces SQLALCHEMY_STATEMENT_TIMEOUT in jobs; keep it
+    # below JOB_TIMEOUT or a slow job is claimed again while it runs
+    JOB_STATEMENT_TIMEOUT = int(os.getenv('JOB_STATEMENT_TIMEOUT', 1800000))
+    # seconds a finished job answers identical requests
+    JOB_RESULT_TTL = int(os.getenv('JOB_RESULT_TTL', 300))
+    # seconds after which a running job is taken as lost and run again
+    JOB_TIMEOUT = int(os.getenv('JOB_TIMEOUT', 3600))
+    JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 2))
+    # 'sync' or 'gevent', with gevent every worker serves up to
+    # GUNICORN_WORKER_CONNECTIONS requests sharing one connection pool,
+    # so size SQLALCHEMY_POOL_SIZE/MAX_OVERFLOW accordingly
+    GUNICORN_WORKER_CLASS = os.getenv('GUNICORN_WORKER_CLASS', 'sync')
+    GUNICORN_WORKERS = int(os.getenv('WEB_CONCURRENCY', 2))
+    GUNICORN_WORKER_CONNECTIONS = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 100))
+    GUNICORN_TIMEOUT = int(os.getenv('GUNICORN_TIMEOUT', 30))
+    GUNICORN_PRELOAD = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+    # 'auto' uses orjson when it is installed, 'orjson' or 'stdlib' force one
+    JSON_ENCODER = os.getenv('JSON_ENCODER', 'auto')
+    # FlaskAPI renders the views' dict returns with the same encoder
+    DEFAULT_RENDERERS = ['app.encoding.JSONRenderer', 'flask_api.renderers.BrowsableAPIRenderer']
 
 
 class DevelopmentConfig(Config):
     """Configurations for Development."""
     DEBUG = True
     SENTRY_URL = ''
+    SQLALCHEMY_POOL_SIZE = 2
+    SQLALCHEMY_MAX_OVERFLOW = 0
+    SQLALCHEMY_STATEMENT_TIMEOUT = 0
 
 
 class TestingConfig(Config):
     """Configurations for Testing, with a separate test database."""
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'postgresql://localhost/test_db'
+    SQLALCHEMY_POOL_PRE_PING = False
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'
     DEBUG = True
 
 
@@ -33,6 +103,8 @@ class ProductionConfig(Config):
     DEBUG = False
     TESTING = False
     SENTRY_URL = os.getenv('SENTRY_URL')
+    SQLALCHEMY_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))
+    SQLALCHEMY_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
 
 
 app_config = {
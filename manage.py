@@ -11,5 +11,176 @@ manager = Manager(app)
 manager.add_command('db', MigrateCommand)
 
 
+def hot_queries():
+    from app.models import Exam, Visit, Metric
+
+    return [
+        ('ix_exams_visit_id_metric_id', Exam.query.filter(Exam.visit_id.in_([1, 2, 3]))),
+        ('ix_exams_metric_id', Exam.query.filter_by(metric_id=1)),
+        ('ix_visits_user_id_date_modified', Visit.query.filter_by(user_id=1).order_by(Visit.date_modified)),
+        ('ix_visits_date_created', Visit.query.order_by(Visit.date_created).limit(20)),
+        ('ix_metrics_gender', Metric.query.filter_by(gender='male')),
+        ('ix_metrics_category_id', Metric.query.filter_by(category_id=1)),
+    ]
+
+
+@manager.command
+def explain():
+    """Check with EXPLAIN that the hot queries use their index."""
+    # small tables are always seq scanned, force the planner to show
+    # whether an index is usable at all
+    db.session.execute('SET enable_seqscan = off')
+    missing = 0
+    for index, query in hot_queries():
+        sql = str(query.statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+        plan = '\n'.join(row[0] for row in db.session.execute('EXPLAIN ' + sql))
+        if index in plan:
+            print('ok      {}'.format(index))
+        else:
+            missing += 1
+            print('MISSING {}\n{}\n{}'.format(index, sql, plan))
+    db.session.rollback()
+    if missing:
+        raise SystemExit(1)
+
+
+@manager.command
+def rebuild_aggregates():
+    """Recompute the metric_aggregates table from the exams."""
+    from app import aggregates
+
+    db.lift_statement_timeout()
+    aggregates.rebuild()
+
+
+@manager.command
+def check_aggregates():
+    """Compare metric_aggregates with the exams and list stale rows."""
+    from app import aggregates
+
+    db.lift_statement_timeout()
+    mismatches = aggregates.check()
+    for key, stored, live in mismatches:
+        print('{} stored={} live={}'.format(key, stored, live))
+    if mismatches:
+        raise SystemExit(1)
+    print('ok')
+
+
+@manager.command
+def rebuild_scores():
+    """Recompute the health score of every visit from its exams."""
+    from app import scores
+
+    db.lift_statement_timeout()
+    scores.rebuild()
+
+
+@manager.option('-w', '--workers', dest='workers', type=int, default=2)
+def run_jobs(workers):
+    """Run queued jobs until interrupted, e.g. in a worker process next to the web ones."""
+    from app.jobs import job_queue
+
+    job_queue.run(workers)
+
+
+@manager.command
+def resume_deletions():
+    """Finish the DELETE ...?async=1 deletions a restart interrupted."""
+    from app.deletion import deleter
+
+    db.lift_statement_timeout()
+    for deletion_id in deleter.resume(app):
+        print('deletion {} resumed'.format(deletion_id))
+
+
+@manager.option('-o', '--output', dest='output', default='exams.csv.gz')
+def export_exams(output):
+    """Export exams with metric, visit and user columns as CSV (gzipped for .gz)."""
+    import gzip
+    from app.export import csv_chunks
+
+    db.lift_statement_timeout()
+    opener = gzip.open if output.endswith('.gz') else open
+    with opener(output, 'wt', newline='') as f:
+        for chunk in csv_chunks():
+            f.write(chunk)
+
+
+
+@manager.option('-e', '--exams', dest='exams', type=int, default=10000)
+@manager.option('-p', '--per-visit', dest='per_visit', type=int, default=12)
+@manager.option('-s', '--seed', dest='seed', type=int, default=1)
+def seed(exams, per_visit, seed):
+    """Generate synthetic users, visits, metrics, categories and exams."""
+    from app import synthetic
+
+    db.lift_statement_timeout()
+    print(synthetic.generate(exams=exams, exams_per_visit=per_visit, seed=seed))
+
+
+@manager.option('-n', '--requests', dest='requests', type=int, default=100)
+@manager.option('-c', '--concurrency', dest='concurrency', type=int, default=1)
+@manager.option('-u', '--url', dest='url', default=None, help='benchmark a running server instead of the app')
+@manager.option('--admin', dest='admin', default='synth1_0')
+@manager.option('--user', dest='user', default='synth1_1')
+@manager.option('--password', dest='password', default='password')
+@manager.option('--read-only', dest='read_only', action='store_true', default=False)
+def benchmark(requests, concurrency, url, admin, user, password, read_only):
+    """Report latency percentiles, throughput and queries per request of every route."""
+    from app.benchmark import TestClientTarget, HttpTarget, run, format_report
+
+    target = HttpTarget(url) if url else TestClientTarget(app)
+    print(format_report(run(target, admin, user, password, requests, concurrency, read_only)))
+
+
+@manager.option('-n', '--logins', dest='logins', type=int, default=200)
+@manager.option('-c', '--concurrency', dest='concurrency', type=int, default=8)
+@manager.option('-u', '--url', dest='url', default=None, help='benchmark a running server instead of the app')
+@manager.option('--user', dest='user', default='synth1_1')
+@manager.option('--password', dest='password', default='password')
+def benchmark_login(logins, concurrency, url, user, password):
+    """Report the latency of /metrics alone and during a burst of logins."""
+    from app.benchmark import TestClientTarget, HttpTarget, login_benchmark, format_report
+
+    target = HttpTarget(url) if url else TestClientTarget(app)
+    print(format_report(login_benchmark(target, user, password, logins, concurrency)))
+
+
+@manager.option('-n', '--writes', dest='writes', type=int, default=500)
+@manager.option('--user', dest='user', default='synth1_1')
+def benchmark_writes(writes, user):
+    """Compare exam creation committing twice, as before the unit of work, with one commit."""
+    from app.benchmark import write_benchmark
+
+    for name, throughput, ms in write_benchmark(user, writes):
+        print('{:<14} {:>9.1f} writes/s {:>9.2f} ms'.format(name, throughput, ms))
+
+
+@manager.option('-n', '--rows', dest='rows', type=int, default=10000)
+@manager.option('-r', '--repeat', dest='repeat', type=int, default=5)
+def benchmark_encoding(rows, repeat):
+    """Report the time to serialize a list endpoint of `rows` exams with every JSON encoder."""
+    from app.benchmark import encode_benchmark
+
+    for name, ms in encode_benchmark(rows, repeat):
+        print('{:<8} {:>9.1f} ms'.format(name, ms))
+
+
+@manager.option('-n', '--runs', dest='runs', type=int, default=5)
+@manager.option('-p', '--pid', dest='pid', type=int, default=None, help='gunicorn master to report the workers of')
+def benchmark_startup(runs, pid):
+    """Report the boot time and memory of the app, and of the workers of a running server."""
+    from app.benchmark import startup_benchmark, worker_memory
+
+    for elapsed, seconds, rss in startup_benchmark(runs):
+        print('boot {:>7.0f} ms  load app {:>7.0f} ms  peak rss {:>7} KiB'.format(
+            elapsed * 1000, seconds * 1000, rss
+        ))
+    if pid is not None:
+        for worker, rss, pss, private in worker_memory(pid):
+            print('worker {:<7} rss {:>7} KiB  pss {:>7} KiB  private {:>7} KiB'.format(worker, rss, pss, private))
+
+
 if __name__ == '__main__':
     manager.run()
@@ -0,0 +1,33 @@
+"""add indexes on foreign keys and filter columns
+
+Revision ID: b3c1d9e4f2a7
+Revises: a2fe20d17de0
+Create Date: 2026-10-18 10:12:40.512318
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3c1d9e4f2a7'
+down_revision = 'a2fe20d17de0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_exams_visit_id_metric_id', 'exams', ['visit_id', 'metric_id'], unique=False)
+    op.create_index(op.f('ix_exams_metric_id'), 'exams', ['metric_id'], unique=False)
+    op.create_index('ix_visits_user_id_date_modified', 'visits', ['user_id', 'date_modified'], unique=False)
+    op.create_index(op.f('ix_visits_date_created'), 'visits', ['date_created'], unique=False)
+    op.create_index(op.f('ix_metrics_gender'), 'metrics', ['gender'], unique=False)
+    op.create_index(op.f('ix_metrics_category_id'), 'metrics', ['category_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_metrics_category_id'), table_name='metrics')
+    op.drop_index(op.f('ix_metrics_gender'), table_name='metrics')
+    op.drop_index(op.f('ix_visits_date_created'), table_name='visits')
+    op.drop_index('ix_visits_user_id_date_modified', table_name='visits')
+    op.drop_index(op.f('ix_exams_metric_id'), table_name='exams')
+    op.drop_index('ix_exams_visit_id_metric_id', table_name='exams')
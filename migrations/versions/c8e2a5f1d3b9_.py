@@ -0,0 +1,39 @@
+"""add metric_aggregates
+
+Revision ID: c8e2a5f1d3b9
+Revises: b3c1d9e4f2a7
+Create Date: 2026-10-18 11:02:17.204551
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8e2a5f1d3b9'
+down_revision = 'b3c1d9e4f2a7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('metric_aggregates',
+    sa.Column('metric_id', sa.Integer(), nullable=False),
+    sa.Column('gender', sa.String(length=255), nullable=False),
+    sa.Column('birth_date', sa.DateTime(), nullable=False),
+    sa.Column('value_sum', sa.BigInteger(), nullable=False),
+    sa.Column('value_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['metric_id'], ['metrics.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('metric_id', 'gender', 'birth_date')
+    )
+    op.execute(
+        'INSERT INTO metric_aggregates (metric_id, gender, birth_date, value_sum, value_count) '
+        'SELECT exams.metric_id, users.gender, users.birth_date, SUM(exams.value), COUNT(exams.value) '
+        'FROM exams JOIN visits ON visits.id = exams.visit_id JOIN users ON users.id = visits.user_id '
+        'WHERE exams.value IS NOT NULL AND users.gender IS NOT NULL AND users.birth_date IS NOT NULL '
+        'GROUP BY exams.metric_id, users.gender, users.birth_date'
+    )
+
+
+def downgrade():
+    op.drop_table('metric_aggregates')
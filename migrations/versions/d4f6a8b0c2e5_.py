@@ -0,0 +1,51 @@
+"""add visit health scores
+
+Revision ID: d4f6a8b0c2e5
+Revises: c8e2a5f1d3b9
+Create Date: 2026-10-18 15:41:09.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4f6a8b0c2e5'
+down_revision = 'c8e2a5f1d3b9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('visits', sa.Column('score_sum', sa.Float(), server_default='0', nullable=False))
+    op.add_column('visits', sa.Column('score_weight', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('visits', sa.Column('health_score', sa.Float(), nullable=True))
+    op.create_index(op.f('ix_visits_health_score'), 'visits', ['health_score'], unique=False)
+    op.create_index('ix_visits_user_id_health_score', 'visits', ['user_id', 'health_score'], unique=False)
+    # same points as app.scores
+    op.execute(
+        'UPDATE visits SET score_sum = totals.score_sum, score_weight = totals.score_weight, '
+        'health_score = 100 * totals.score_sum / NULLIF(totals.score_weight, 0) '
+        'FROM (SELECT exams.visit_id, '
+        'SUM(metrics.weight * CASE '
+        'WHEN exams.value BETWEEN metrics.healthy_range_min AND metrics.healthy_range_max THEN 1.0 '
+        'WHEN exams.value < metrics.healthy_range_min THEN GREATEST(0, 1 - '
+        'CAST(metrics.healthy_range_min - exams.value AS FLOAT) / '
+        'NULLIF(metrics.healthy_range_min - metrics.total_range_min, 0)) '
+        'ELSE GREATEST(0, 1 - CAST(exams.value - metrics.healthy_range_max AS FLOAT) / '
+        'NULLIF(metrics.total_range_max - metrics.healthy_range_max, 0)) END) AS score_sum, '
+        'SUM(metrics.weight) AS score_weight '
+        'FROM exams JOIN metrics ON metrics.id = exams.metric_id '
+        'WHERE exams.value IS NOT NULL AND metrics.healthy_range_min IS NOT NULL '
+        'AND metrics.healthy_range_max IS NOT NULL AND metrics.weight > 0 '
+        'GROUP BY exams.visit_id) AS totals '
+        'WHERE visits.id = totals.visit_id'
+    )
+
+
+def downgrade():
+    op.drop_index('ix_visits_user_id_health_score', table_name='visits')
+    op.drop_index(op.f('ix_visits_health_score'), table_name='visits')
+    op.drop_column('visits', 'health_score')
+    op.drop_column('visits', 'score_weight')
+    op.drop_column('visits', 'score_sum')
@@ -0,0 +1,33 @@
+"""cascade exam and visit deletes in the database
+
+Revision ID: e7a9c1d3f5b8
+Revises: d4f6a8b0c2e5
+Create Date: 2026-10-18 17:12:44.905117
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a9c1d3f5b8'
+down_revision = 'd4f6a8b0c2e5'
+branch_labels = None
+depends_on = None
+
+FOREIGN_KEYS = (
+    ('exams_visit_id_fkey', 'exams', 'visits', 'visit_id'),
+    ('exams_metric_id_fkey', 'exams', 'metrics', 'metric_id'),
+    ('visits_user_id_fkey', 'visits', 'users', 'user_id'),
+)
+
+
+def upgrade():
+    for name, source, referent, column in FOREIGN_KEYS:
+        op.drop_constraint(name, source, type_='foreignkey')
+        op.create_foreign_key(name, source, referent, [column], ['id'], ondelete='CASCADE')
+
+
+def downgrade():
+    for name, source, referent, column in FOREIGN_KEYS:
+        op.drop_constraint(name, source, type_='foreignkey')
+        op.create_foreign_key(name, source, referent, [column], ['id'])
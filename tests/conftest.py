@@ -0,0 +1,68 @@
+import datetime
+
+import pytest
+
+from app import create_app, db
+from app.models import Exam, Visit, User, Metric, Category
+
+DAYS_PER_YEAR = 365.2425
+
+
+@pytest.fixture(scope='session')
+def app():
+    """The app on TestingConfig, with fresh tables in its test database."""
+    app = create_app('testing')
+    app.config['SECRET'] = 'test-secret'
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def session(app):
+    yield db.session
+    db.session.rollback()
+    for table in reversed(db.metadata.sorted_tables):
+        db.session.execute(table.delete())
+    db.session.commit()
+
+
+def add_user(username, gender='male', age_days=40 * DAYS_PER_YEAR, admin=False, password=None):
+    birth_date = datetime.datetime.now() - datetime.timedelta(days=age_days)
+    user = User(username=username, email='{}@example.com'.format(username), gender=gender,
+                birth_date=birth_date)
+    user.admin = admin
+    if password is not None:
+        user.hash_password(password)
+    db.session.add(user)
+    db.session.flush()
+    return user
+
+
+def add_metric(name, gender='male', category=None, healthy=(70, 100), total=(0, 200)):
+    metric = Metric(name=name, weight=1, unit_label='mg/dl', total_range_min=total[0], total_range_max=total[1],
+                    healthy_range_min=healthy[0], healthy_range_max=healthy[1], gender=gender)
+    metric.category = category
+    db.session.add(metric)
+    db.session.flush()
+    return metric
+
+
+def add_category(name):
+    category = Category(name=name)
+    db.session.add(category)
+    db.session.flush()
+    return category
+
+
+def add_visit(user, values):
+    """A visit of `user` with an exam per (metric, value) pair."""
+    visit = Visit(name='visit', user=user)
+    db.session.add(visit)
+    for metric, value in values:
+        db.session.add(Exam(metric=metric, value=value, visit=visit))
+    db.session.flush()
+    return visit
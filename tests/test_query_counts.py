@@ -0,0 +1,77 @@
+import itertools
+import re
+
+import pytest
+
+from app import db
+from app.auth import user_cache
+from app.cache import catalog_cache
+from app.models import User
+from tests.conftest import add_user, add_metric, add_category, add_visit
+
+# written by app.instrumentation, which counts every statement of the request
+QUERIES = re.compile(r'desc="(\d+) queries"')
+
+ENDPOINTS = (
+    '/exams',
+    '/exams?limit=100',
+    '/exams?status=out_of_range&sort=deviation',
+    '/exams?fields=id,value,metricName',
+    '/visits',
+    '/visits?sort=score',
+    '/visits/exams?userId={patient}',
+    '/visits/history?userId={patient}',
+    '/metrics',
+    '/metrics/data?gender=male',
+    '/users',
+    '/exams/statistics?gender=male&age=0,120',
+)
+
+names = itertools.count()
+
+
+def grow(patient_id):
+    """More of every row the endpoints list: metrics, a user and visits.
+
+    The requests remove the session, so the patient is loaded again.
+    """
+    patient = User.query.get(patient_id)
+    category = add_category('category{}'.format(next(names)))
+    metrics = [add_metric('metric{}'.format(next(names)), category=category) for _ in range(3)]
+    metrics.append(add_metric('metric{}'.format(next(names))))
+    other = add_user('user{}'.format(next(names)))
+    for user in (patient, other):
+        for i in range(3):
+            add_visit(user, [(metric, 50 + 20 * i) for metric in metrics])
+    db.session.commit()
+
+
+def count_queries(client, path, token):
+    # cold caches, so every request runs the queries of a miss
+    catalog_cache.invalidate()
+    user_cache.clear()
+    response = client.get(path, headers={'Authorization': token})
+    assert response.status_code == 200, path
+    return int(QUERIES.search(response.headers['Server-Timing']).group(1))
+
+
+@pytest.fixture
+def admin_token(app, session):
+    add_user('admin', admin=True, password='password')
+    db.session.commit()
+    response = app.test_client().post('/login', json={'username': 'admin', 'password': 'password'})
+    return response.get_json()['access_token']
+
+
+@pytest.mark.parametrize('endpoint', ENDPOINTS)
+def test_query_count_does_not_grow_with_the_rows(app, admin_token, endpoint):
+    patient_id = add_user('patient').id
+    grow(patient_id)
+    path = endpoint.format(patient=patient_id)
+    client = app.test_client()
+
+    counts = [count_queries(client, path, admin_token)]
+    for _ in range(2):
+        grow(patient_id)
+        counts.append(count_queries(client, path, admin_token))
+    assert len(set(counts)) == 1, counts
@@ -0,0 +1,99 @@
+import datetime
+
+import pytest
+from sqlalchemy.sql import func
+
+from app import db
+from app.models import Exam, Visit, Metric
+from app.statistics import DAYS_PER_YEAR, birth_date_bounds, cohort_visit_ids, metric_averages, \
+    cohort_metric_averages
+from tests.conftest import add_user, add_metric, add_visit
+
+
+def baseline_visit_ids(gender, age, ranges):
+    """The Python loop /exams/statistics ran before the cohort query."""
+    visit_ids = []
+    for visit in Visit.query.all():
+        visit_age = (datetime.datetime.now() - visit.user.birth_date).days // DAYS_PER_YEAR
+        if visit.user.gender != gender:
+            continue
+        if visit_age < age[0] or visit_age > age[1]:
+            continue
+
+        good_visit = True
+        for name, (low, high) in ranges.items():
+            for exam in visit.exams:
+                if exam.metric.name == name:
+                    if exam.value < low or exam.value > high:
+                        good_visit = False
+                        break
+        if good_visit:
+            visit_ids.append(visit.id)
+    return set(visit_ids)
+
+
+def baseline_averages(visit_ids):
+    averages = Exam.query.with_entities(
+        Exam.metric_id, func.avg(Exam.value)
+    ).filter(Exam.visit_id.in_(visit_ids)).group_by(Exam.metric_id).all()
+    return {Metric.query.get(metric_id).name: int(avg) for metric_id, avg in averages}
+
+
+def averages(rows):
+    return {name: int(avg) for name, avg in rows}
+
+
+@pytest.mark.parametrize('age_min,age_max', [(0, 120), (30, 60), (40, 40), (18, 25), (61, 70)])
+def test_birth_date_bounds_match_the_age_formula(age_min, age_max):
+    now = datetime.datetime(2026, 3, 1, 12, 0, 0)
+    oldest, youngest = birth_date_bounds(age_min, age_max, now)
+    for years in (age_min - 1, age_min, age_max, age_max + 1):
+        edge = now - datetime.timedelta(days=years * DAYS_PER_YEAR)
+        for days in range(-3, 4):
+            for seconds in (-1, 0, 1):
+                birth_date = edge + datetime.timedelta(days=days, seconds=seconds)
+                age = (now - birth_date).days // DAYS_PER_YEAR
+                assert (oldest < birth_date <= youngest) == (age_min <= age <= age_max), birth_date
+
+
+@pytest.fixture
+def cohort(session):
+    glucose = add_metric('glucose')
+    weight = add_metric('weight', healthy=(60, 90))
+    female_glucose = add_metric('glucose', gender='female')
+    users = []
+    # ages around the edges of the 30-60 window, an hour inside and outside them
+    for i, days in enumerate([
+        30 * DAYS_PER_YEAR + 1 / 24.0, 30 * DAYS_PER_YEAR - 1 / 24.0,
+        61 * DAYS_PER_YEAR - 1 / 24.0, 61 * DAYS_PER_YEAR + 1 / 24.0,
+        45 * DAYS_PER_YEAR, 20 * DAYS_PER_YEAR, 80 * DAYS_PER_YEAR,
+    ]):
+        users.append(add_user('user{}'.format(i), age_days=days))
+    female = add_user('female', gender='female')
+
+    for i, user in enumerate(users):
+        add_visit(user, [(glucose, 80 + i * 5), (weight, 70 + i)])
+        add_visit(user, [(glucose, 120 + i), (weight, 50)])
+        add_visit(user, [(weight, 75)])
+    add_visit(users[4], [])
+    add_visit(female, [(female_glucose, 90)])
+    db.session.commit()
+
+
+@pytest.mark.parametrize('gender,age,ranges', [
+    ('male', (30, 60), {}),
+    ('male', (0, 120), {}),
+    ('male', (30, 60), {'glucose': (70, 100)}),
+    ('male', (30, 60), {'glucose': (70, 130), 'weight': (60, 90)}),
+    ('male', (45, 45), {'weight': (0, 200)}),
+    ('male', (30, 60), {'missing': (0, 1)}),
+    ('female', (30, 60), {}),
+    ('female', (30, 60), {'glucose': (0, 50)}),
+])
+def test_cohort_matches_the_python_loop(cohort, gender, age, ranges):
+    expected = baseline_visit_ids(gender, age, ranges)
+    visit_ids = set(row[0] for row in cohort_visit_ids(gender, age, ranges))
+    assert visit_ids == expected
+
+    assert averages(metric_averages(cohort_visit_ids(gender, age, ranges))) == baseline_averages(expected)
+    assert averages(cohort_metric_averages(gender, age, ranges)) == baseline_averages(expected)